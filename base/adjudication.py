@@ -0,0 +1,164 @@
+"""
+Batch claim adjudication for insurers.
+
+adjudicate_claims applies the same rules as the process_claim view to a list
+of decisions, but loads claims, subscriptions and existing payments in one
+query each and writes every claim update, Payment, Transaction and ledger
+change in bulk inside a single transaction. Invalid decisions are reported
+per item and do not stop the rest of the batch.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import invalidate_dashboard_summaries
+from .ledger import record_claim_payouts
+from .models import Claim, Payment, Transaction, UserPolicies
+
+MAX_BATCH = 5000
+BATCH_SIZE = 500
+MAX_AMOUNT = Decimal('1e13')
+
+
+def parse_decision(decision):
+    """Return (claim_id, status, payout_amount, note) or raise ValueError with the reason."""
+    if not isinstance(decision, dict):
+        raise ValueError('Each decision must be an object')
+    try:
+        claim_id = int(decision.get('claim_id'))
+    except (TypeError, ValueError):
+        raise ValueError('claim_id is required')
+
+    status = decision.get('status')
+    if status not in ['Approved', 'Denied']:
+        raise ValueError('Invalid status value')
+
+    payout_amount = None
+    if status == 'Approved':
+        if decision.get('payout_amount') is None:
+            raise ValueError('Payout amount is required for approval')
+        try:
+            payout_amount = Decimal(str(decision['payout_amount'])).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError('Invalid payout amount')
+        # Payment.amount holds 15 digits, 2 of them decimals
+        if payout_amount <= 0 or payout_amount >= MAX_AMOUNT:
+            raise ValueError('Invalid payout amount')
+    return claim_id, status, payout_amount, decision.get('adjustment_note')
+
+
+def load_subscriptions(claims):
+    """First subscription per (claimant, policy), as process_claim picks it."""
+    subscriptions = UserPolicies.objects.filter(
+        user_id__in={claim.claimant_id for claim in claims},
+        policy_id__in={claim.policy_id for claim in claims}
+    ).only('id', 'user_id', 'policy_id', 'plan_type', 'momo_number').order_by('-id')
+    # Iterating newest first leaves the oldest row per pair in the dict
+    return {(sub.user_id, sub.policy_id): sub for sub in subscriptions}
+
+
+def update_claims(claims):
+    """
+    Write the adjudicated fields of `claims` with one executemany.
+
+    bulk_update builds a CASE expression per field that gets slow for
+    thousands of rows, while a single parameterized UPDATE stays linear.
+    """
+    fields = [Claim._meta.get_field(name) for name in ('status', 'payout_amount', 'approval_date', 'adjustment_note')]
+    table = connection.ops.quote_name(Claim._meta.db_table)
+    assignments = ", ".join(f"{connection.ops.quote_name(field.column)} = %s" for field in fields)
+    rows = [
+        [field.get_db_prep_save(getattr(claim, field.attname), connection) for field in fields] + [claim.pk]
+        for claim in claims
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(f"UPDATE {table} SET {assignments} WHERE id = %s", rows)
+
+
+def adjudicate_claims(decisions):
+    """Apply a list of decisions and return one result dict per decision, in order."""
+    results = [None] * len(decisions)
+    parsed = {}
+    for index, decision in enumerate(decisions):
+        try:
+            claim_id, status, payout_amount, note = parse_decision(decision)
+        except ValueError as e:
+            claim_id = decision.get('claim_id') if isinstance(decision, dict) else None
+            results[index] = {'claim_id': claim_id, 'ok': False, 'error': str(e)}
+            continue
+        if claim_id in parsed:
+            results[index] = {'claim_id': claim_id, 'ok': False, 'error': 'Duplicate decision for this claim'}
+            continue
+        parsed[claim_id] = (index, status, payout_amount, note)
+
+    with transaction.atomic():
+        claims = Claim.objects.select_for_update().filter(id__in=parsed).select_related('policy').only(
+            'id', 'claim_number', 'claimant_id', 'policy_id', 'status', 'payout_amount',
+            'approval_date', 'adjustment_note',
+            'policy__premium_coverage_amount', 'policy__regular_coverage_amount'
+        ).in_bulk()
+        subscriptions = load_subscriptions(claims.values())
+        paid_claim_ids = set(Payment.objects.filter(claim_id__in=claims).values_list('claim_id', flat=True))
+
+        now = timezone.now()
+        updated_claims, payments, transactions = [], [], []
+        payouts = {}
+        for claim_id, (index, status, payout_amount, note) in parsed.items():
+            claim = claims.get(claim_id)
+            if claim is None:
+                results[index] = {'claim_id': claim_id, 'ok': False, 'error': 'Claim not found'}
+                continue
+
+            subscription = subscriptions.get((claim.claimant_id, claim.policy_id))
+            if status == 'Approved' and subscription:
+                max_coverage = (
+                    claim.policy.premium_coverage_amount if subscription.plan_type == 'Premium'
+                    else claim.policy.regular_coverage_amount
+                )
+                if payout_amount > max_coverage:
+                    results[index] = {
+                        'claim_id': claim_id,
+                        'ok': False,
+                        'error': f'Payout amount exceeds {subscription.plan_type} plan coverage of GHS {max_coverage}'
+                    }
+                    continue
+
+            claim.status = status
+            claim.approval_date = now
+            if note:
+                claim.adjustment_note = note
+            if status == 'Approved':
+                claim.payout_amount = payout_amount
+                # Prevent duplicate payments
+                if claim_id not in paid_claim_ids:
+                    payments.append(Payment(claim_id=claim_id, amount=payout_amount, is_paid=True))
+                    if subscription:
+                        transactions.append(Transaction(
+                            user_id=claim.claimant_id,
+                            policy_subscription_id=subscription.id,
+                            transaction_type="Claim Payout",
+                            claim_id=claim_id,
+                            amount=payout_amount,
+                            momo_number=subscription.momo_number
+                        ))
+                    payouts.setdefault(claim.claimant_id, []).append(payout_amount)
+            updated_claims.append(claim)
+            results[index] = {
+                'claim_id': claim_id,
+                'ok': True,
+                'claim_number': claim.claim_number,
+                'status': status,
+                'payout_amount': claim.payout_amount if status == 'Approved' else None,
+            }
+
+        update_claims(updated_claims)
+        Payment.objects.bulk_create(payments, batch_size=BATCH_SIZE)
+        Transaction.objects.bulk_create(transactions, batch_size=BATCH_SIZE)
+        # bulk writes skip the model signals, so the ledger and dashboards are updated here
+        if payouts:
+            record_claim_payouts(payouts)
+        claimant_ids = {claim.claimant_id for claim in updated_claims}
+        transaction.on_commit(lambda: invalidate_dashboard_summaries(claimant_ids))
+
+    return results
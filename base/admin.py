@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import (
- UserPolicies, Category, Company, InsurancePolicy, Claim,  Messages, Transaction, ClaimDocument, Payment
+ UserPolicies, Category, Company, InsurancePolicy, Claim,  Messages, Transaction, ClaimDocument, Payment, UserLedger, ChatSession, ClaimUpload
 )
 
 # Register your models here.
@@ -13,4 +13,7 @@ admin.site.register(Claim)
 admin.site.register(Messages)
 admin.site.register(ClaimDocument)
 admin.site.register(Transaction)
-admin.site.register(Payment)
\ No newline at end of file
+admin.site.register(Payment)
+admin.site.register(UserLedger)
+admin.site.register(ChatSession)
+admin.site.register(ClaimUpload)
\ No newline at end of file
@@ -1,74 +1,48 @@
 import os
 import json
-from difflib import get_close_matches
-import requests
-from groq import Groq
+import time
+import asyncio
+from asgiref.sync import sync_to_async
+from . import llm
+from .cache import cached_catalog_data
+from .categories import resolve_category
+from .chat_sessions import get_session_store
+from .history import compact, make_message
+from .intent import get_intent_classifier, intent_classifier_ready
+from .interaction_log import interaction_log, read_interactions
+from .response_cache import response_cache
 from .models import InsurancePolicy
 from .serializers import InsurancePolicySerializer
 
-# Load environment variables (add this if using .env file)
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-    print("✅ dotenv loaded successfully")
-except ImportError:
-    print("❌ python-dotenv not installed. Install with: pip install python-dotenv")
-
-# Load subcategories
-subcategories_path = os.path.join(os.path.dirname(__file__), 'subcategories.json')
-try:
-    with open(subcategories_path, 'r') as file:
-        subcategories = json.load(file)
-    print("✅ Subcategories loaded successfully")
-except FileNotFoundError:
-    print("❌ subcategories.json not found")
-    subcategories = []
-
-# Initialize Groq client with error handling
-def get_groq_client():
-    # Try to get API key from environment
-    api_key = os.getenv('GROQ_API_KEY')
-    
-    print(f"🔍 Environment API Key: {'Found' if api_key else 'Not Found'}")
-    
-    if not api_key:
-        print("❌ GROQ_API_KEY environment variable not set")
-        print("Please set it with: export GROQ_API_KEY=your_api_key_here")
-        return None
-    
-    try:
-        client = Groq(api_key=api_key)
-        print("✅ Groq client initialized successfully")
-        return client
-    except Exception as e:
-        print(f"❌ Error initializing Groq client: {e}")
-        return None
+# Define the categories that should populate the label
+valid_categories = [
+    "Disability", "Travel", "Business", "Home",
+    "Auto", "Health", "Life",
+]
 
-client = get_groq_client()
+# Keyword arguments shared by every completion request
+COMPLETION_OPTIONS = {
+    "model": "llama3-70b-8192",
+    "temperature": 0.7,
+    "max_tokens": 1024,
+    "top_p": 1,
+    "stop": None,
+    "stream": False,
+}
 
-# Session-based conversation history (in production, use Redis or database)
-conversation_sessions = {}
+UNAVAILABLE_RESPONSE = {
+    "chatbot_response": "Sorry, the AI service is currently unavailable.",
+    "policies_response": None
+}
 
-def get_chatbot_response(user_input, session_id='default'):
-    global client
-    
-    if not client:
-        return {
-            "chatbot_response": "Sorry, the AI service is currently unavailable.",
-            "policies_response": None
-        }
-    
-    # Get or create session history
-    if session_id not in conversation_sessions:
-        conversation_sessions[session_id] = []
-    
-    conversation_history = conversation_sessions[session_id]
-    
-    # Define the categories that should populate the label
-    valid_categories = [
-        "Disability", "Travel", "Business", "Home",
-        "Auto", "Health", "Life",
-    ]
+ERROR_RESPONSE = {
+    "chatbot_response": "Sorry, I'm having trouble processing your request right now.",
+    "policies_response": None
+}
+
+def start_turn(user_input, session_id):
+    """Load the session, add the user message and return the history to send."""
+    conversation_history = get_session_store().load(session_id)
     
     # Add system message if this is a new session
     if not conversation_history:
@@ -83,144 +57,309 @@ def get_chatbot_response(user_input, session_id='default'):
         }
         conversation_history.append(system_message)
     
-    # Add the user message to the conversation history
-    conversation_history.append({"role": "user", "content": user_input})
+    # Add the user message, folding older turns into the summary when over budget
+    conversation_history.append(make_message("user", user_input))
+    return compact(conversation_history)
+
+def is_first_turn(conversation_history):
+    # Only the system prompt and the new user message
+    return len(conversation_history) == 2
+
+def save_reply(session_id, conversation_history, response_content):
+    # Add the assistant response to the conversation history
+    conversation_history.append(make_message("assistant", response_content))
+    get_session_store().save(session_id, conversation_history)
+
+def begin_turn(user_input, session_id):
+    """
+    start_turn plus a response cache lookup for first turns.
+
+    Returns (conversation_history, cached_response); on a hit the turn is
+    already saved and cached_response is what to send back.
+    """
+    conversation_history = start_turn(user_input, session_id)
+    if not is_first_turn(conversation_history):
+        return conversation_history, None
+
+    cached = response_cache.get(user_input)
+    if cached is None:
+        return conversation_history, None
+
+    response_content, combined_response = cached
+    save_reply(session_id, conversation_history, response_content)
+    if isinstance(combined_response["chatbot_response"], dict):
+        response_json = combined_response["chatbot_response"]
+        log_interaction(user_input, response_json.get("label"), response_json.get("answer", ""))
+    return conversation_history, combined_response
+
+def finish_turn(user_input, session_id, conversation_history, response_content):
+    """Save the assistant reply and attach policies when it names a category."""
+    first_turn = is_first_turn(conversation_history)
+    save_reply(session_id, conversation_history, response_content)
+    
+    combined_response = {
+        "chatbot_response": response_content,
+        "policies_response": None
+    }
+    
+    # Check if the response is in JSON format and extract the "label" field
+    try:
+        response_json = json.loads(response_content)
+        
+        if isinstance(response_json, dict) and "label" in response_json:
+            label = response_json.get("label", "")
+            
+            if label in valid_categories:
+                category_id = get_category_id(label)
+                policies = get_policies(category_id)
+                combined_response["chatbot_response"] = response_json
+                combined_response["policies_response"] = policies
+                
+                # Log the interaction in chat_interactions.json
+                log_interaction(user_input, label, response_json.get("answer", ""))
+                
+    except json.JSONDecodeError:
+        label = None
+    
+    if first_turn:
+        response_cache.set(user_input, (response_content, combined_response))
+
+    # Return the generated JSON content or text response
+    return combined_response
+
+def reply_text(combined_response):
+    """The assistant message as text, the way the LLM would have produced it."""
+    reply = combined_response["chatbot_response"]
+    return reply if isinstance(reply, str) else json.dumps(reply)
+
+def classify_locally(user_input):
+    """Category label for plain category lookups, None when the LLM is needed."""
+    classifier = get_intent_classifier(valid_categories, read_logged_interactions)
+    return classifier.classify(user_input)
+
+async def aclassify_locally(user_input):
+    """
+    classify_locally for the async views. The first call trains the model,
+    which reads Future.json and the interaction log, so it runs in a worker
+    thread instead of stalling every other request on the event loop.
+    """
+    if not intent_classifier_ready():
+        return await asyncio.to_thread(classify_locally, user_input)
+    return classify_locally(user_input)
+
+def train_intent_classifier():
+    """Train the classifier now instead of on the first chat."""
+    get_intent_classifier(valid_categories, read_logged_interactions)
+
+def answer_locally(user_input, session_id, label):
+    """Answer a category lookup without the LLM, recorded like an LLM reply."""
+    classifier = get_intent_classifier(valid_categories, read_logged_interactions)
+    conversation_history = start_turn(user_input, session_id)
+    response_content = json.dumps({"label": label, "answer": classifier.answer_for(label)})
+    return finish_turn(user_input, session_id, conversation_history, response_content)
+
+def get_chatbot_response(user_input, session_id='default'):
+    label = classify_locally(user_input)
+    if label:
+        try:
+            return answer_locally(user_input, session_id, label)
+        except Exception as e:
+            print(f"Error getting chatbot response: {e}")
+            return dict(ERROR_RESPONSE)
+
+    try:
+        conversation_history, cached_response = begin_turn(user_input, session_id)
+    except Exception as e:
+        print(f"Error getting chatbot response: {e}")
+        return dict(ERROR_RESPONSE)
+    if cached_response:
+        return cached_response
+
+    client = llm.get_client()
+    if not client:
+        return dict(UNAVAILABLE_RESPONSE)
     
     try:
         # Generate a response from the chatbot using the entire conversation history
         chat_completion = client.chat.completions.create(
             messages=conversation_history,
-            model="llama3-70b-8192",
-            temperature=0.7,
-            max_tokens=1024,
-            top_p=1,
-            stop=None,
-            stream=False
+            **COMPLETION_OPTIONS
         )
         
         response_content = chat_completion.choices[0].message.content
+        return finish_turn(user_input, session_id, conversation_history, response_content)
         
-        # Add the assistant response to the conversation history
-        conversation_history.append({"role": "assistant", "content": response_content})
-        
-        # Limit conversation history to prevent token overflow
-        if len(conversation_history) > 20:
-            # Keep system message and last 18 messages
-            conversation_sessions[session_id] = [conversation_history[0]] + conversation_history[-18:]
-        
-        combined_response = {
-            "chatbot_response": response_content,
-            "policies_response": None
-        }
-        
-        # Check if the response is in JSON format and extract the "label" field
+    except Exception as e:
+        print(f"Error getting chatbot response: {e}")
+        return dict(ERROR_RESPONSE)
+
+async def aget_chatbot_response(user_input, session_id='default'):
+    """Async twin of get_chatbot_response for the ASGI chatbot view."""
+    label = await aclassify_locally(user_input)
+    if label:
         try:
-            response_json = json.loads(response_content)
-            
-            if isinstance(response_json, dict) and "label" in response_json:
-                label = response_json.get("label", "")
-                
-                if label in valid_categories:
-                    category_id = get_category_id(label)
-                    policies = get_policies(category_id)
-                    combined_response["chatbot_response"] = response_json
-                    combined_response["policies_response"] = policies
-                    
-                    # Log the interaction in chat_interactions.json
-                    log_interaction(user_input, label, response_json.get("answer", ""))
-                    
-        except json.JSONDecodeError:
-            label = None
-        
-        # Return the generated JSON content or text response
-        return combined_response
-        
+            return await sync_to_async(answer_locally)(user_input, session_id, label)
+        except Exception as e:
+            print(f"Error getting chatbot response: {e}")
+            return dict(ERROR_RESPONSE)
+
+    try:
+        conversation_history, cached_response = await sync_to_async(begin_turn)(user_input, session_id)
     except Exception as e:
         print(f"Error getting chatbot response: {e}")
-        return {
-            "chatbot_response": "Sorry, I'm having trouble processing your request right now.",
-            "policies_response": None
-        }
+        return dict(ERROR_RESPONSE)
+    if cached_response:
+        return cached_response
+
+    async_client = llm.get_async_client()
+    if not async_client:
+        return dict(UNAVAILABLE_RESPONSE)
 
-# Rest of your functions remain the same...
-BASE_URL = 'http://localhost:5173'
+    async with llm.llm_slot():
+        try:
+            chat_completion = await asyncio.wait_for(
+                async_client.chat.completions.create(
+                    messages=conversation_history,
+                    **COMPLETION_OPTIONS
+                ),
+                llm.LLM_TIMEOUT
+            )
+            response_content = chat_completion.choices[0].message.content
+        except Exception as e:
+            print(f"Error getting chatbot response: {e}")
+            return dict(ERROR_RESPONSE)
 
-def get_categories():
     try:
-        response = requests.get(f'{BASE_URL}categories/')
-        response.raise_for_status()
-        
-        with open('subcategories.json', 'w') as file:
-            json.dump(response.json(), file)
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
-        return None
+        # Category lookup, policies and logging touch the database and disk
+        return await sync_to_async(finish_turn)(user_input, session_id, conversation_history, response_content)
+    except Exception as e:
+        print(f"Error getting chatbot response: {e}")
+        return dict(ERROR_RESPONSE)
+
+async def astream_chatbot_response(user_input, session_id='default'):
+    """
+    Streaming variant of aget_chatbot_response.
+
+    Yields ("token", text) for each piece of the reply as the LLM produces it,
+    then a single ("done", response) once the full message has gone through
+    finish_turn, or ("error", response) if the completion fails.
+    LLM_TIMEOUT bounds the whole generation, not each token.
+    """
+    label = await aclassify_locally(user_input)
+    if label:
+        try:
+            response = await sync_to_async(answer_locally)(user_input, session_id, label)
+        except Exception as e:
+            print(f"Error streaming chatbot response: {e}")
+            yield "error", dict(ERROR_RESPONSE)
+            return
+        # The whole answer is ready at once, so it goes out as one token
+        yield "token", reply_text(response)
+        yield "done", response
+        return
+
+    try:
+        conversation_history, cached_response = await sync_to_async(begin_turn)(user_input, session_id)
+    except Exception as e:
+        print(f"Error streaming chatbot response: {e}")
+        yield "error", dict(ERROR_RESPONSE)
+        return
+    if cached_response:
+        yield "token", reply_text(cached_response)
+        yield "done", cached_response
+        return
+
+    async_client = llm.get_async_client()
+    if not async_client:
+        yield "error", dict(UNAVAILABLE_RESPONSE)
+        return
+
+    async with llm.llm_slot():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + llm.LLM_TIMEOUT
+        parts = []
+        try:
+            stream = await asyncio.wait_for(
+                async_client.chat.completions.create(
+                    messages=conversation_history,
+                    **{**COMPLETION_OPTIONS, "stream": True}
+                ),
+                llm.LLM_TIMEOUT
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    parts.append(token)
+                    yield "token", token
+        except Exception as e:
+            print(f"Error streaming chatbot response: {e}")
+            yield "error", dict(ERROR_RESPONSE)
+            return
+
+    try:
+        response = await sync_to_async(finish_turn)(user_input, session_id, conversation_history, "".join(parts))
+    except Exception as e:
+        print(f"Error streaming chatbot response: {e}")
+        yield "error", dict(ERROR_RESPONSE)
+        return
+    yield "done", response
 
 def get_category_id(subcat_name):
-    if not subcat_name or not subcategories:
-        return None
-        
-    subcat_name = subcat_name.lower()
-    subcategory_names = [subcat['name'].lower() for subcat in subcategories]
-    
-    close_match = get_close_matches(subcat_name, subcategory_names, n=1, cutoff=0.6)
-    
-    if close_match:
-        matched_subcategory_name = close_match[0]
-        category_id = next(
-            (subcat['id'] for subcat in subcategories 
-             if subcat['name'].lower() == matched_subcategory_name), 
-            None
-        )
-        return category_id
-    
-    return None
+    return resolve_category(subcat_name)
+
+# How recommended policies are ordered and how many are sent with a reply
+POLICY_RANKINGS = {
+    "rating": ("-company__rating", "regular", "id"),
+    "price": ("regular", "-company__rating", "id"),
+    "none": ("id",),
+}
+POLICY_RANKING = os.getenv('CHATBOT_POLICY_RANKING', 'rating')
+POLICY_LIMIT = int(os.getenv('CHATBOT_POLICY_LIMIT', '0')) or None
+
+def build_policy_snapshot(category_id):
+    """Serialized active policies of a category, in one query."""
+    policies = InsurancePolicy.objects.filter(
+        company__company_category=category_id,
+        is_active=True
+    ).select_related('company', 'category').order_by(*POLICY_RANKINGS.get(POLICY_RANKING, ("id",)))
+    return list(InsurancePolicySerializer(policies, many=True).data)
 
-def get_policies(category_id):
+def get_policies(category_id, limit=POLICY_LIMIT):
     try:
         if category_id is None:
             return {"message": "We don't offer these type of policies yet"}
-            
-        policies = InsurancePolicy.objects.filter(company__company_category=category_id)
-        
-        if not policies.exists():
+
+        # Snapshots live in the shared catalog cache, so catalog writes drop them
+        policies = cached_catalog_data(
+            f"chat_policies:{POLICY_RANKING}:{category_id}",
+            lambda: build_policy_snapshot(category_id)
+        )
+
+        if not policies:
             return {"message": "We don't offer these type of policies yet"}
-        
-        policy_serializer = InsurancePolicySerializer(policies, many=True)
-        return {"policies": policy_serializer.data}
+
+        return {"policies": policies[:limit]}
         
     except Exception as e:
         print(f"Error fetching policies: {e}")
         return {"message": "Error fetching policies"}
 
+def read_logged_interactions():
+    return read_interactions(interaction_log)
+
 def log_interaction(user_input, label, answer):
-    log_entry = {
-        "timestamp": json.dumps({"$date": {"$numberLong": str(int(os.time.time() * 1000))}}),
+    interaction_log.append({
+        "timestamp": json.dumps({"$date": {"$numberLong": str(int(time.time() * 1000))}}),
         "tag": label,
         "user_input": user_input,
         "ai_response": answer,
         "category": label
-    }
-    
-    try:
-        log_file = 'chat_interactions.json'
-        if os.path.exists(log_file):
-            with open(log_file, 'r+') as file:
-                try:
-                    data = json.load(file)
-                except json.JSONDecodeError:
-                    data = []
-                
-                data.append(log_entry)
-                file.seek(0)
-                file.truncate()
-                json.dump(data, file, indent=2)
-        else:
-            with open(log_file, 'w') as file:
-                json.dump([log_entry], file, indent=2)
-                
-    except Exception as e:
-        print(f"Error logging interaction: {e}")
+    })
 
 # Progressive chat loop with memory
 def chat_loop():
@@ -233,5 +372,4 @@ def chat_loop():
         print(f"Bot: {response}\n")
 
 if __name__ == "__main__":
-    get_categories()  # activate this to populate the subcategories JSON file
     chat_loop()
@@ -1,6 +1,18 @@
+import os
+
 from django.apps import AppConfig
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Set on chat-serving workers only; ready() also runs for every manage.py command
+        if os.getenv('CHATBOT_PREWARM', 'false').lower() == 'true':
+            from .ai_logic import train_intent_classifier
+            from .llm import prewarm
+            prewarm()
+            train_intent_classifier()
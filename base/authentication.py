@@ -0,0 +1,89 @@
+"""
+Token authentication that skips the database on repeat requests.
+
+DRF's TokenAuthentication joins authtoken_token to auth_user on every
+request, and role checks such as is_insurer added a groups query on top.
+CachedTokenAuthentication keeps the user's fields and group names under the
+token for TOKEN_CACHE_TIMEOUT seconds and rebuilds request.user from them,
+with the group names on request.user.roles. signals.py forgets the entry
+when the token is deleted (logout), the user is saved or their groups
+change; with a per-process cache such as locmem other workers only notice
+once the timeout passes.
+"""
+import hashlib
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+TOKEN_CACHE_TIMEOUT = 60
+# Never cached, loaded from the database if something reads it
+UNCACHED_FIELDS = {'password'}
+
+
+def token_cache_key(key):
+    # Hashed so cache dumps and key listings do not reveal usable tokens
+    return f"auth_token:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def user_roles(user):
+    """Group names of `user`, from the cache when CachedTokenAuthentication loaded it."""
+    roles = getattr(user, 'roles', None)
+    if roles is not None:
+        return roles
+    if not user.is_authenticated:
+        return frozenset()
+    return frozenset(user.groups.values_list('name', flat=True))
+
+
+def forget_token(key):
+    """
+    Drop the cached principal for `key` once the current transaction commits;
+    deleting it earlier lets a concurrent request cache the token again from
+    the still visible row.
+    """
+    transaction.on_commit(lambda: cache.delete(token_cache_key(key)))
+
+
+def forget_user_tokens(user_ids):
+    """Drop cached principals for these users once the current transaction commits."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    def forget():
+        keys = Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True)
+        cache.delete_many([token_cache_key(key) for key in keys])
+    transaction.on_commit(forget)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        entry = cache.get(cache_key)
+        if entry is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            user = token.user
+            if not user.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+            fields = {
+                field.attname: getattr(user, field.attname)
+                for field in User._meta.concrete_fields
+                if field.attname not in UNCACHED_FIELDS
+            }
+            entry = {'fields': fields, 'roles': list(user_roles(user))}
+            cache.set(cache_key, entry, TOKEN_CACHE_TIMEOUT)
+
+        names = list(entry['fields'])
+        user = User.from_db(DEFAULT_DB_ALIAS, names, [entry['fields'][name] for name in names])
+        user.roles = frozenset(entry['roles'])
+        token = Token(key=key, user=user)
+        token._state.adding = False
+        return user, token
@@ -0,0 +1,145 @@
+"""
+Recurring monthly premiums for subscriptions.
+
+join_policy charges the first month of a subscription; bill_subscriptions
+charges every later month of UserPolicies.duration once it has started,
+catching up on any months a missed run skipped. Active subscriptions are
+read in id order one chunk at a time, so memory stays flat however many
+there are, and each chunk is billed in its own transaction that locks its
+rows, inserts the Policy Payment transactions in bulk, advances
+UserPolicies.periods_billed and updates the ledgers. A rerun, a run resumed
+after a crash or two overlapping runs therefore never charge a month twice;
+the (policy_subscription, billing_period) constraint on Transaction backs
+that up.
+
+With workers > 1 the id range is split between that many processes on a
+database server; SQLite always bills in one. Models are imported inside the
+functions so spawned workers can load this module before django.setup().
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from dateutil.relativedelta import relativedelta
+from django.db import connection, connections, transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+CHUNK_SIZE = 1000
+BATCH_SIZE = 500
+
+
+def billable_subscriptions():
+    from .models import UserPolicies
+
+    return UserPolicies.objects.filter(status='Active', periods_billed__lt=F('duration'))
+
+
+def periods_due(creation_date, duration, periods_billed, today):
+    """Billing periods after periods_billed that have started by `today`."""
+    start = timezone.localdate(creation_date)
+    elapsed = relativedelta(today, start)
+    months = elapsed.years * 12 + elapsed.months
+    # Month ends: a subscription from Jan 31 starts its second month on Feb 28
+    if start + relativedelta(months=months + 1) <= today:
+        months += 1
+    current = min(duration, months + 1)
+    return list(range(periods_billed + 1, current + 1))
+
+
+def bill_chunk(after_id, today, chunk_size=CHUNK_SIZE, until_id=None):
+    """
+    Bill up to chunk_size subscriptions with an id above after_id.
+
+    Returns (last id read, subscriptions read, charges created); the last
+    id is None once the range is exhausted.
+    """
+    from .ledger import record_policy_payments
+    from .models import Transaction, UserPolicies
+
+    subscriptions = billable_subscriptions().filter(id__gt=after_id).order_by('id')
+    if until_id is not None:
+        subscriptions = subscriptions.filter(id__lte=until_id)
+
+    with transaction.atomic():
+        rows = list(subscriptions.select_for_update(of=('self',)).values_list(
+            'id', 'user_id', 'plan_type', 'duration', 'momo_number', 'creation_date', 'periods_billed',
+            'policy__premium', 'policy__regular'
+        )[:chunk_size])
+        if not rows:
+            return None, 0, 0
+
+        charges, payments, billed = [], {}, {}
+        for (subscription_id, user_id, plan_type, duration, momo_number, creation_date, periods_billed,
+             premium, regular) in rows:
+            periods = periods_due(creation_date, duration, periods_billed, today)
+            if not periods:
+                continue
+            monthly_price = premium if plan_type == 'Premium' else regular
+            for period in periods:
+                charges.append(Transaction(
+                    user_id=user_id,
+                    policy_subscription_id=subscription_id,
+                    transaction_type="Policy Payment",
+                    amount=monthly_price,
+                    momo_number=momo_number,
+                    billing_period=period
+                ))
+                payments.setdefault(user_id, []).append(monthly_price)
+            billed.setdefault(periods[-1], []).append(subscription_id)
+
+        Transaction.objects.bulk_create(charges, batch_size=BATCH_SIZE)
+        # One UPDATE per distinct period, usually just this month's
+        for periods_billed, subscription_ids in billed.items():
+            UserPolicies.objects.filter(id__in=subscription_ids).update(periods_billed=periods_billed)
+        # bulk_create skips the Transaction signals, so the ledger and dashboards are updated here
+        if payments:
+            record_policy_payments(payments)
+
+    return rows[-1][0], len(rows), len(charges)
+
+
+def bill_range(after_id, until_id, today, chunk_size=CHUNK_SIZE):
+    """Bill every due subscription with after_id < id <= until_id; return (read, charged)."""
+    read = charged = 0
+    while True:
+        last_id, chunk_read, chunk_charged = bill_chunk(after_id, today, chunk_size, until_id)
+        if last_id is None:
+            return read, charged
+        read += chunk_read
+        charged += chunk_charged
+        after_id = last_id
+
+
+def id_ranges(workers):
+    """Split the billable id space into up to `workers` (after_id, until_id) ranges."""
+    bounds = billable_subscriptions().aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    after_id = bounds['low'] - 1
+    step = max(-(-(bounds['high'] - after_id) // workers), 1)
+    ranges = []
+    while after_id < bounds['high']:
+        ranges.append((after_id, min(after_id + step, bounds['high'])))
+        after_id += step
+    return ranges
+
+
+def bill_subscriptions(today=None, workers=1, chunk_size=CHUNK_SIZE):
+    """Charge every month that has started by `today`; return (subscriptions read, charges created)."""
+    today = today or timezone.localdate()
+    if connection.vendor == 'sqlite':
+        # SQLite takes one writer at a time, so extra processes would only queue on its lock
+        workers = 1
+    ranges = id_ranges(max(workers, 1))
+    if workers <= 1 or len(ranges) <= 1:
+        results = [bill_range(after_id, until_id, today, chunk_size) for after_id, until_id in ranges]
+    else:
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=len(ranges), initializer=django.setup) as executor:
+            futures = [
+                executor.submit(bill_range, after_id, until_id, today, chunk_size)
+                for after_id, until_id in ranges
+            ]
+            results = [future.result() for future in futures]
+    return sum(read for read, _ in results), sum(charged for _, charged in results)
@@ -0,0 +1,91 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+# Dashboard numbers are invalidated on every relevant write (see signals.py),
+# the timeout only bounds how long a missed invalidation can linger.
+DASHBOARD_SUMMARY_TIMEOUT = 60 * 15
+
+
+def dashboard_summary_key(user_id):
+    return f"dashboard_summary:{user_id}"
+
+
+def invalidate_dashboard_summary(user_id):
+    cache.delete(dashboard_summary_key(user_id))
+
+
+def invalidate_dashboard_summaries(user_ids):
+    cache.delete_many([dashboard_summary_key(user_id) for user_id in user_ids])
+
+
+# Catalog entries are keyed by a version that every policy/company/category
+# write bumps (see signals.py), so one cache.set invalidates all of them.
+# With a per-process backend such as locmem, other workers only pick up a
+# change once the timeout passes; configure a shared backend to avoid that.
+CATALOG_CACHE_TIMEOUT = 60 * 5
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    # Millisecond timestamp, forced forward in case of two writes in one tick
+    previous = cache.get(CATALOG_VERSION_KEY) or 0
+    cache.set(CATALOG_VERSION_KEY, max(int(time.time() * 1000), previous + 1), None)
+
+
+def settled_last_modified(entry):
+    """
+    The entry's Last-Modified second, or None while that second is still
+    running: a second write within it would carry the same date, so until
+    the clock moves on only the ETag can tell the two versions apart.
+    """
+    last_modified = entry['last_modified']
+    return last_modified if last_modified < int(time.time()) else None
+
+
+def cached_catalog_payload(name, build):
+    """
+    Return the rendered JSON for a catalog payload with its validators.
+
+    `build` is only called on a miss and may return None for a missing
+    object, which is not cached.
+    """
+    version = catalog_version()
+    key = f"catalog:{version}:{name}"
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        if data is None:
+            return None
+        content = JSONRenderer().render(data)
+        entry = {
+            'content': content,
+            'etag': quote_etag(hashlib.md5(content).hexdigest()),
+            'last_modified': version // 1000,
+        }
+        cache.set(key, entry, CATALOG_CACHE_TIMEOUT)
+    return entry
+
+
+def cached_catalog_data(name, build):
+    """
+    Like cached_catalog_payload, but cache what `build` returns as is, for
+    callers that embed it in a larger response.
+    """
+    key = f"catalog:{catalog_version()}:{name}"
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, CATALOG_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,107 @@
+"""
+Resolve category names from chatbot labels to Category ids.
+
+The resolver is built from the Category table and answers with dict lookups:
+the exact name, then aliases (the keywords the intent classifier is seeded
+with, e.g. "car" -> Auto), and only then a fuzzy match through a trigram
+index for misspellings. Each process keeps one resolver and rebuilds it when
+the catalog version moves, which Category saves and deletes bump (see
+signals.py).
+"""
+import re
+import threading
+from collections import Counter, defaultdict
+
+from .cache import catalog_version
+from .intent import SEED_KEYWORDS
+
+# Minimum Dice similarity between trigram sets for a fuzzy match
+MIN_SIMILARITY = 0.5
+NOISE_WORDS = {"insurance", "insurances", "policy", "policies", "cover", "coverage", "plan", "plans"}
+
+
+def normalize(name):
+    words = re.findall(r"[a-z0-9]+", name.lower())
+    return " ".join(word for word in words if word not in NOISE_WORDS)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CategoryResolver:
+    def __init__(self, categories, version=None):
+        """`categories` is an iterable of (id, name) pairs."""
+        self.version = version
+        self.exact = {}
+        for category_id, name in categories:
+            key = normalize(name)
+            if key:
+                self.exact.setdefault(key, category_id)
+
+        self.aliases = {}
+        for name, keywords in SEED_KEYWORDS.items():
+            category_id = self.exact.get(normalize(name))
+            if category_id is None:
+                continue
+            for keyword in keywords.split():
+                self.aliases.setdefault(keyword, category_id)
+
+        # trigram -> keys containing it, plus each key's trigram count
+        self.index = defaultdict(list)
+        self.sizes = {}
+        for key in list(self.exact) + list(self.aliases):
+            grams = trigrams(key)
+            self.sizes[key] = len(grams)
+            for gram in grams:
+                self.index[gram].append(key)
+
+    def resolve(self, name):
+        """Return the Category id for `name`, or None when nothing is close."""
+        if not name:
+            return None
+        key = normalize(name)
+        if key in self.exact:
+            return self.exact[key]
+        if key in self.aliases:
+            return self.aliases[key]
+        return self.fuzzy(key)
+
+    def fuzzy(self, key):
+        grams = trigrams(key)
+        shared = Counter(candidate for gram in grams for candidate in self.index.get(gram, ()))
+        if not shared:
+            return None
+        # Dice similarity, so a long name sharing more trigrams does not beat a closer short one
+        similarity = {
+            candidate: 2 * overlap / (len(grams) + self.sizes[candidate])
+            for candidate, overlap in shared.items()
+        }
+        best = max(similarity, key=lambda candidate: (similarity[candidate], candidate in self.exact))
+        if similarity[best] < MIN_SIMILARITY:
+            return None
+        return self.exact.get(best) or self.aliases[best]
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_category_resolver():
+    """Share one resolver per process, rebuilt after catalog changes."""
+    global _resolver
+    version = catalog_version()
+    resolver = _resolver
+    if resolver is None or resolver.version != version:
+        from .models import Category
+
+        with _resolver_lock:
+            if _resolver is None or _resolver.version != version:
+                _resolver = CategoryResolver(Category.objects.values_list('id', 'name'), version)
+            resolver = _resolver
+    return resolver
+
+
+def resolve_category(name):
+    return get_category_resolver().resolve(name)
@@ -0,0 +1,208 @@
+"""
+Conversation history storage for the chatbot.
+
+The store is picked by settings.CHATBOT_SESSIONS['BACKEND']. Every store
+evicts sessions idle for longer than TTL seconds and keeps at most
+MAX_SESSIONS sessions / MAX_BYTES of serialized history, dropping the least
+recently used first.
+"""
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+DEFAULTS = {
+    'BACKEND': 'base.chat_sessions.DatabaseSessionStore',
+    'TTL': 60 * 60 * 24,
+    'MAX_SESSIONS': 10000,
+    'MAX_BYTES': 50 * 1024 * 1024,
+}
+
+
+def history_size(history):
+    return len(json.dumps(history).encode('utf-8'))
+
+
+class SessionStore(ABC):
+    def __init__(self, ttl, max_sessions, max_bytes):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        # Counted per process, so only meaningful for per-process stores
+        self.evictions = 0
+
+    @abstractmethod
+    def load(self, session_id):
+        """Return a copy of the session's history, [] for a new or expired one."""
+
+    @abstractmethod
+    def save(self, session_id, history):
+        pass
+
+    @abstractmethod
+    def delete(self, session_id):
+        pass
+
+    @abstractmethod
+    def purge(self):
+        """Evict expired sessions and enforce the caps; returns how many went."""
+
+    @abstractmethod
+    def stats(self):
+        """Return {'sessions': ..., 'bytes': ..., 'evictions': ...}."""
+
+
+class MemorySessionStore(SessionStore):
+    """Per-process LRU store. Sessions do not survive restarts or span workers."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        # session_id -> (history, size, last_used)
+        self.sessions = OrderedDict()
+        self.total_bytes = 0
+
+    def load(self, session_id):
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return []
+            history, size, last_used = entry
+            if time.monotonic() - last_used > self.ttl:
+                self._remove(session_id)
+                self.evictions += 1
+                return []
+            self.sessions.move_to_end(session_id)
+            return list(history)
+
+    def save(self, session_id, history):
+        size = history_size(history)
+        with self.lock:
+            self._remove(session_id)
+            self.sessions[session_id] = (list(history), size, time.monotonic())
+            self.total_bytes += size
+            self._evict()
+
+    def delete(self, session_id):
+        with self.lock:
+            self._remove(session_id)
+
+    def purge(self):
+        with self.lock:
+            cutoff = time.monotonic() - self.ttl
+            expired = [key for key, (_, _, last_used) in self.sessions.items() if last_used < cutoff]
+            for session_id in expired:
+                self._remove(session_id)
+            self.evictions += len(expired)
+            return len(expired) + self._evict()
+
+    def stats(self):
+        with self.lock:
+            return {'sessions': len(self.sessions), 'bytes': self.total_bytes, 'evictions': self.evictions}
+
+    def _remove(self, session_id):
+        entry = self.sessions.pop(session_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def _evict(self):
+        evicted = 0
+        while self.sessions and (len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            _, (_, size, _) = self.sessions.popitem(last=False)
+            self.total_bytes -= size
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+
+class DatabaseSessionStore(SessionStore):
+    """
+    ChatSession-backed store shared by every worker and kept across restarts.
+
+    Expiry and the caps are enforced every PURGE_EVERY saves rather than on
+    each one, so the tables can briefly run over the limits.
+    """
+    PURGE_EVERY = 100
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saves = 0
+
+    @property
+    def model(self):
+        from .models import ChatSession
+        return ChatSession
+
+    def load(self, session_id):
+        session = self.model.objects.filter(
+            session_id=session_id,
+            updated_at__gte=self.expiry_cutoff()
+        ).only('history').first()
+        return list(session.history) if session else []
+
+    def save(self, session_id, history):
+        self.model.objects.update_or_create(
+            session_id=session_id,
+            defaults={'history': history, 'size': history_size(history)}
+        )
+        self.saves += 1
+        if self.saves % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def delete(self, session_id):
+        self.model.objects.filter(session_id=session_id).delete()
+
+    def purge(self):
+        evicted, _ = self.model.objects.filter(updated_at__lt=self.expiry_cutoff()).delete()
+
+        # Walk from the most recent session and drop everything past the caps
+        kept = kept_bytes = 0
+        stale_ids = []
+        for pk, size in self.model.objects.order_by('-updated_at').values_list('pk', 'size').iterator():
+            kept += 1
+            kept_bytes += size
+            if kept > self.max_sessions or kept_bytes > self.max_bytes:
+                stale_ids.append(pk)
+        for start in range(0, len(stale_ids), 500):
+            deleted, _ = self.model.objects.filter(pk__in=stale_ids[start:start + 500]).delete()
+            evicted += deleted
+
+        self.evictions += evicted
+        return evicted
+
+    def stats(self):
+        totals = self.model.objects.aggregate(bytes=Sum('size'))
+        return {
+            'sessions': self.model.objects.count(),
+            'bytes': totals['bytes'] or 0,
+            'evictions': self.evictions,
+        }
+
+    def expiry_cutoff(self):
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = {**DEFAULTS, **getattr(settings, 'CHATBOT_SESSIONS', {})}
+                store_class = import_string(options['BACKEND'])
+                _store = store_class(
+                    ttl=options['TTL'],
+                    max_sessions=options['MAX_SESSIONS'],
+                    max_bytes=options['MAX_BYTES'],
+                )
+    return _store
@@ -0,0 +1,163 @@
+"""
+Serve stored claim files to callers the view has already authorized.
+
+With settings.DOCUMENT_DELIVERY['MODE'] set to 'accel' (nginx) or 'sendfile'
+(Apache/lighttpd), the response only carries X-Accel-Redirect/X-Sendfile and
+the front server streams the file, ranges included, without holding a
+worker. The 'python' fallback answers conditional GETs and single byte
+ranges itself and hands the open file to the server's wsgi.file_wrapper,
+which gunicorn turns into a zero-copy sendfile bounded by Content-Length.
+ASGI servers get no such wrapper: Django reads the file and sends it chunk
+by chunk through the event loop, which is why the README keeps document
+downloads on the WSGI workers.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.static import serve
+
+from .storage import blob_digest
+
+DEFAULTS = {
+    'MODE': 'python',
+    'ACCEL_PREFIX': '/protected-media/',
+    'MAX_AGE': 60 * 60,
+}
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Types a browser shows without running anything; the rest are downloaded
+# as opaque bytes so an uploaded .html or .svg never renders on our origin
+INLINE_TYPES = {'application/pdf', 'image/gif', 'image/jpeg', 'image/png', 'image/webp'}
+# Claim files, blobs and derivatives; only served by serve_file after an access check
+PRIVATE_MEDIA_DIR = 'claim_documents'
+
+
+def delivery_options():
+    return {**DEFAULTS, **getattr(settings, 'DOCUMENT_DELIVERY', {})}
+
+
+class RangeFile:
+    """File wrapper that stops reading after `length` bytes from its position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) for a single satisfiable range, None to send the whole
+    file, or False when the range cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Multiple or malformed ranges: the full body is a valid answer
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def serve_file(request, storage, name, filename):
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+
+    options = delivery_options()
+    size = stat.st_size
+    etag = quote_etag(blob_digest(name) or f"{int(stat.st_mtime)}-{size}")
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(filename)[0]
+        disposition = 'inline'
+        if content_type not in INLINE_TYPES:
+            content_type, disposition = 'application/octet-stream', 'attachment'
+        if options['MODE'] == 'accel':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = quote(options['ACCEL_PREFIX'].rstrip('/') + '/' + name)
+        elif options['MODE'] == 'sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+        else:
+            response = python_response(request, path, size, etag, content_type)
+        response['Content-Disposition'] = f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f"private, max-age={options['MAX_AGE']}"
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def python_response(request, path, size, etag, content_type):
+    byte_range = None
+    header = request.headers.get('Range')
+    # If-Range: only honour the range while the client's copy is current
+    if header and request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_range(header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_public_media(request, path, document_root):
+    """
+    django.views.static.serve for the DEBUG media route, minus claim documents.
+
+    serve() normalizes the path itself, so the check runs on the same
+    normalized form: //claim_documents/..., ./claim_documents/... and
+    x/../claim_documents/... all name the private directory.
+    """
+    normalized = posixpath.normpath(path.replace('\\', '/')).lstrip('/')
+    top = normalized.split('/', 1)[0]
+    # lower(): case-insensitive filesystems would also serve Claim_Documents/
+    if top.lower() == PRIVATE_MEDIA_DIR:
+        raise Http404
+    return serve(request, path, document_root)
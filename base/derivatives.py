@@ -0,0 +1,147 @@
+"""
+Thumbnails and web previews of claim document images.
+
+When a document is saved, a small thread pool renders a thumbnail for grids
+and a downscaled progressive JPEG preview for the review screen, and records
+their storage names on ClaimDocument.derivatives. Until that has happened
+the serializer points at the document_derivative view, which renders on
+first request instead. Derivatives are named after the source's content
+hash, so documents sharing a blob share their derivatives too.
+"""
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow documents are served without derivatives
+    Image = None
+
+# Largest first: each variant is downscaled from the one before it
+VARIANTS = {
+    'preview': {'size': (1600, 1600), 'quality': 82},
+    'thumbnail': {'size': (320, 320), 'quality': 70},
+}
+DERIVATIVE_DIR = 'claim_documents/derivatives'
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+# Threads rendering derivatives after upload; 0 leaves it all to first request
+WORKERS = int(os.getenv('CLAIM_DERIVATIVE_WORKERS', '2'))
+UNSUPPORTED = 'unsupported'
+
+
+def is_image(document):
+    name = document.filename or document.file.name
+    return Image is not None and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_path(key, variant):
+    return f"{DERIVATIVE_DIR}/{variant}/{key[:2]}/{key}.jpg"
+
+
+def derivative_name(document, variant):
+    return derivative_path(document.sha256 or f"document-{document.pk}", variant)
+
+
+def store_derivative(name, data):
+    """
+    Write `data` to exactly `name`, replacing it atomically.
+
+    The pool and the on-demand view can render the same document at once;
+    storage.save would give the loser a suffixed copy nobody references.
+    """
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return name
+
+
+def delete_derivatives(digest):
+    """Remove the thumbnail and preview of a blob that is being collected."""
+    for variant in VARIANTS:
+        default_storage.delete(derivative_path(digest, variant))
+
+
+def render(source):
+    """Yield (variant, JPEG bytes) for every variant, decoding the source once."""
+    with Image.open(source) as image:
+        # Let the JPEG decoder skip detail the largest variant would throw away
+        image.draft('RGB', VARIANTS['preview']['size'])
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for variant, options in VARIANTS.items():
+            image.thumbnail(options['size'], Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=options['quality'], optimize=True, progressive=True)
+            yield variant, output.getvalue()
+
+
+def generate_derivatives(document):
+    """Render whatever derivatives are missing and record them on the document."""
+    if not is_image(document):
+        derivatives = {UNSUPPORTED: True}
+    else:
+        names = {variant: derivative_name(document, variant) for variant in VARIANTS}
+        derivatives = {}
+        try:
+            if not all(default_storage.exists(name) for name in names.values()):
+                with document.file.open('rb') as source:
+                    for variant, data in render(source):
+                        if not default_storage.exists(names[variant]):
+                            store_derivative(names[variant], data)
+            derivatives = names
+        # Truncated or malformed images also surface as ValueError, SyntaxError or EOFError
+        except (OSError, ValueError, SyntaxError, EOFError, Image.DecompressionBombError) as e:
+            print(f"Error rendering derivatives for document {document.pk}: {e}")
+            derivatives = {UNSUPPORTED: True}
+
+    type(document).objects.filter(pk=document.pk).update(derivatives=derivatives)
+    document.derivatives = derivatives
+    return derivatives
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='claim-derivatives')
+    return _executor
+
+
+def render_in_pool(document_id):
+    from .models import ClaimDocument
+
+    try:
+        document = ClaimDocument.objects.filter(pk=document_id).first()
+        if document is not None and not document.derivatives:
+            generate_derivatives(document)
+    except Exception as e:
+        print(f"Error rendering derivatives for document {document_id}: {e}")
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(document):
+    """Queue rendering for after the document's transaction commits."""
+    if WORKERS <= 0 or not is_image(document):
+        return
+    document_id = document.pk
+    transaction.on_commit(lambda: get_executor().submit(render_in_pool, document_id))
@@ -0,0 +1,67 @@
+"""
+Move subscriptions past their expiry_date from Active to Complete.
+
+join_policy sets expiry_date but nothing ever ended a subscription, so the
+status='Active' filters in submit_claim, list_claims and dashboard_summary
+kept matching every subscription ever sold. expire_subscriptions walks the
+(status, expiry_date) index a chunk at a time and ends each chunk with one
+set-based UPDATE. Rows leave the Active set as they are updated, so every
+chunk just takes the next oldest expiries and memory stays flat. A
+subscription is only completed once billing has charged all of its months,
+so a run that comes before bill_subscriptions leaves it for the next sweep.
+
+Queryset updates skip the model signals, so each committed chunk sends
+subscriptions_expired with the affected user ids; signals.py drops their
+cached dashboard summaries and anything else keyed on subscription status
+can listen to it too.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import UserPolicies
+
+CHUNK_SIZE = 1000
+
+# Sent after commit with user_ids: the owners of the subscriptions just expired
+subscriptions_expired = Signal()
+
+
+def expired_subscriptions(today):
+    # Coverage runs through the expiry date itself. Subscriptions with months
+    # still unbilled wait for bill_subscriptions, which only bills Active ones.
+    return UserPolicies.objects.filter(
+        status='Active', expiry_date__lt=today, periods_billed__gte=F('duration')
+    )
+
+
+def expire_chunk(today, chunk_size=CHUNK_SIZE):
+    """
+    Complete up to chunk_size expired subscriptions.
+
+    Returns (rows found, rows completed); the two differ only when a
+    concurrent run got to some of them first.
+    """
+    with transaction.atomic():
+        rows = list(expired_subscriptions(today).order_by('expiry_date', 'id').values_list('id', 'user_id')[:chunk_size])
+        if not rows:
+            return 0, 0
+        # Re-checking the status keeps a concurrent run from counting a row twice
+        expired = expired_subscriptions(today).filter(id__in=[subscription_id for subscription_id, _ in rows]).update(
+            status='Complete'
+        )
+        user_ids = sorted({user_id for _, user_id in rows})
+        transaction.on_commit(lambda: subscriptions_expired.send(sender=UserPolicies, user_ids=user_ids))
+    return len(rows), expired
+
+
+def expire_subscriptions(today=None, chunk_size=CHUNK_SIZE):
+    """Complete every subscription that expired before `today`; return the count."""
+    today = today or timezone.localdate()
+    total = 0
+    while True:
+        found, expired = expire_chunk(today, chunk_size)
+        if not found:
+            return total
+        total += expired
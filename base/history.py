@@ -0,0 +1,100 @@
+"""
+Token-budgeted conversation history for the chatbot.
+
+Token counts are estimated locally (about four characters per token), so no
+tokenizer round trip is needed. The prompt sent for a turn is the system
+prompt, an optional rolling summary of earlier turns and the most recent
+messages verbatim, and it never exceeds HISTORY_TOKENS. When the recent
+messages outgrow the budget, the oldest ones are folded into the summary
+until they fit in LOW_WATER of it again, so the summary only changes every
+few turns instead of on each one.
+"""
+import json
+import math
+import os
+
+CHARS_PER_TOKEN = 4
+# Role and separators the API adds around each message
+MESSAGE_OVERHEAD = 4
+
+HISTORY_TOKENS = int(os.getenv('CHATBOT_HISTORY_TOKENS', '3000'))
+SUMMARY_TOKENS = int(os.getenv('CHATBOT_SUMMARY_TOKENS', '400'))
+# Longer messages are clipped before they are stored or sent
+MESSAGE_TOKENS = int(os.getenv('CHATBOT_MESSAGE_TOKENS', '1000'))
+SUMMARY_LINE_TOKENS = 40
+LOW_WATER = 0.5
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(message):
+    return MESSAGE_OVERHEAD + estimate_tokens(message["content"])
+
+
+def history_tokens(history):
+    return sum(message_tokens(message) for message in history)
+
+
+def clip(text, tokens):
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:tokens * CHARS_PER_TOKEN - 1].rstrip() + "…"
+
+
+def make_message(role, content):
+    return {"role": role, "content": clip(content, MESSAGE_TOKENS)}
+
+
+def is_summary(message):
+    return message["role"] == "system" and message["content"].startswith(SUMMARY_PREFIX)
+
+
+def summary_line(message):
+    content = " ".join(message["content"].split())
+    if message["role"] == "assistant":
+        # Category replies are JSON; the label is what matters later on
+        try:
+            reply = json.loads(message["content"])
+        except json.JSONDecodeError:
+            reply = None
+        if isinstance(reply, dict) and reply.get("label"):
+            return f"- Assistant suggested {reply['label']} policies"
+    speaker = "User" if message["role"] == "user" else "Assistant"
+    return f"- {speaker}: {clip(content, SUMMARY_LINE_TOKENS)}"
+
+
+def summarize(summary, evicted):
+    """Fold evicted messages into the summary, dropping its oldest lines when it runs over."""
+    lines = summary["content"][len(SUMMARY_PREFIX):].splitlines() if summary else []
+    lines += [summary_line(message) for message in evicted]
+    while len(lines) > 1 and message_tokens({"content": SUMMARY_PREFIX + "\n".join(lines)}) > SUMMARY_TOKENS:
+        lines.pop(0)
+    return {"role": "system", "content": clip(SUMMARY_PREFIX + "\n".join(lines), SUMMARY_TOKENS - MESSAGE_OVERHEAD)}
+
+
+def compact(history, budget=None):
+    """
+    Return `history` fitted into `budget` tokens.
+
+    history[0] is the system prompt and is always kept, as is the last
+    message. Older messages move into the summary a whole turn at a time.
+    """
+    budget = budget or HISTORY_TOKENS
+    system, rest = history[:1], history[1:]
+    summary = rest.pop(0) if rest and is_summary(rest[0]) else None
+
+    reserved = history_tokens(system) + SUMMARY_TOKENS
+    if history_tokens(history) <= budget:
+        return history
+
+    target = max(budget - reserved, 0) * LOW_WATER
+    evicted = []
+    while len(rest) > 1 and (history_tokens(rest) > target or rest[0]["role"] != "user"):
+        evicted.append(rest.pop(0))
+    if evicted:
+        summary = summarize(summary, evicted)
+    return system + ([summary] if summary else []) + rest
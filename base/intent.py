@@ -0,0 +1,162 @@
+"""
+In-process intent classifier for the chatbot's category lookups.
+
+Requests like "i want a car insurance" only ever resolve to one of the
+valid categories, so they can be answered without an LLM round trip. The
+model is a TF-IDF keyword scorer trained from a seed lexicon, the patterns
+in Future.json and the categorized requests in the interaction log. It only
+answers when one category clearly wins and the message does not read like an
+open-ended question; everything else still goes to the LLM.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+FUTURE_PATH = os.path.join(settings.BASE_DIR, 'Future.json')
+
+# Minimum summed weight for the winning category, and its minimum share of
+# all category scores
+MIN_SCORE = float(os.getenv('CHATBOT_INTENT_MIN_SCORE', '0.5'))
+MIN_SHARE = float(os.getenv('CHATBOT_INTENT_MIN_SHARE', '0.8'))
+MAX_TOKENS = 16
+
+SEED_KEYWORDS = {
+    "Auto": "car cars auto automobile vehicle motor motorbike motorcycle truck taxi driver driving",
+    "Health": "health medical hospital doctor surgery clinic illness sickness dental prescription",
+    "Life": "life funeral death beneficiary family dependants",
+    "Home": "home house household property apartment building fire flood burglary tenant landlord",
+    "Travel": "travel travelling traveling trip flight abroad vacation holiday luggage visa",
+    "Business": "business company shop enterprise liability media commercial employees office",
+    "Disability": "disability disabled incapacity impairment injury handicap",
+}
+
+STOPWORDS = {
+    "i", "a", "an", "the", "for", "on", "of", "to", "in", "is", "am", "are", "and", "or",
+    "my", "me", "we", "our", "you", "your", "it", "with", "please", "some", "any",
+    "want", "need", "get", "looking", "like", "would", "buy", "find", "show", "give",
+    "insurance", "insurances", "insure", "policy", "policies", "plan", "plans", "cover",
+    "coverage", "agency", "agencies", "agent", "agents", "provider", "providers",
+}
+
+# Words that turn a message into an open-ended question for the LLM
+OPEN_ENDED_WORDS = {
+    "what", "why", "how", "when", "which", "who", "explain", "difference", "compare",
+    "versus", "vs", "should", "better", "best", "mean", "means", "work", "works",
+}
+
+
+def stem(word):
+    for suffix in ("ing", "es", "s"):
+        if word.endswith(suffix) and not word.endswith("ss") and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in re.findall(r"[a-z]+", text.lower())]
+
+
+class IntentClassifier:
+    def __init__(self, examples, answers):
+        """
+        `examples` maps a category to training texts; `answers` maps a
+        category to the canned reply used when it wins.
+        """
+        self.answers = answers
+
+        term_counts = {
+            label: Counter(token for text in texts for token in tokenize(text) if token not in STOPWORDS)
+            for label, texts in examples.items()
+        }
+        document_frequency = Counter(token for counts in term_counts.values() for token in counts)
+        label_count = len(term_counts)
+
+        # token -> [(label, weight)], so scoring only touches the query's tokens
+        self.index = defaultdict(list)
+        for label, counts in term_counts.items():
+            for token, count in counts.items():
+                idf = math.log(1 + label_count / document_frequency[token])
+                self.index[token].append((label, (1 + math.log(count)) * idf))
+
+    def scores(self, text):
+        totals = defaultdict(float)
+        for token in set(tokenize(text)):
+            for label, weight in self.index.get(token, ()):
+                totals[label] += weight
+        return totals
+
+    def classify(self, text):
+        """Return the category label when confident, else None."""
+        words = re.findall(r"[a-z]+", text.lower())
+        if not words or len(words) > MAX_TOKENS:
+            return None
+        if "?" in text or OPEN_ENDED_WORDS.intersection(words):
+            return None
+
+        totals = self.scores(text)
+        if not totals:
+            return None
+        label, best = max(totals.items(), key=lambda item: item[1])
+        if best < MIN_SCORE or best / sum(totals.values()) < MIN_SHARE:
+            return None
+        return label
+
+    def answer_for(self, label):
+        return self.answers.get(label) or f"Here is a list of {label.lower()} insurance policies we offer."
+
+
+def load_training_data(categories, interactions=()):
+    examples = {label: [SEED_KEYWORDS.get(label, label)] for label in categories}
+    answers = {}
+
+    try:
+        with open(FUTURE_PATH, 'r') as file:
+            intents = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        intents = []
+    for intent in intents:
+        label = intent.get("subcat") or intent.get("tag")
+        if label not in examples:
+            continue
+        examples[label].extend(intent.get("patterns", []))
+        if intent.get("responses"):
+            answers.setdefault(label, intent["responses"][0])
+
+    # Past categorized chats are labelled examples too
+    for entry in interactions:
+        label = entry.get("category") or entry.get("tag")
+        if label in examples and entry.get("user_input"):
+            examples[label].append(entry["user_input"])
+
+    return examples, answers
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier(categories, interactions_loader=lambda: ()):
+    """Build the classifier on first use and share it across threads."""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = IntentClassifier(*load_training_data(categories, interactions_loader()))
+    return _classifier
+
+
+def intent_classifier_ready():
+    """True once the classifier is trained, so classifying will not block on training."""
+    return _classifier is not None
+
+
+def reset_intent_classifier():
+    """Drop the trained model so the next call retrains (e.g. after new logs)."""
+    global _classifier
+    with _classifier_lock:
+        _classifier = None
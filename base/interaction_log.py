@@ -0,0 +1,173 @@
+"""
+Append-only JSONL log of categorized chatbot interactions.
+
+Entries are queued in memory and a background thread appends them in
+batches, one write per batch, every FLUSH_INTERVAL seconds or as soon as
+BATCH_SIZE entries are waiting. Writes from several worker processes are
+serialized with an advisory lock on a sidecar file (where fcntl exists), and
+the file is rotated to .1, .2, ... once it grows past MAX_BYTES.
+read_interactions streams every file back, oldest first, one entry at a time.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: O_APPEND still keeps each batch write intact
+    fcntl = None
+
+LOG_PATH = os.getenv('CHATBOT_INTERACTION_LOG', os.path.join(settings.BASE_DIR, 'chat_interactions.jsonl'))
+MAX_BYTES = int(os.getenv('CHATBOT_INTERACTION_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+BACKUPS = int(os.getenv('CHATBOT_INTERACTION_LOG_BACKUPS', '5'))
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 1.0
+# Queued by close() to tell the writer to return once it reaches it
+_STOP = object()
+
+
+class InteractionLog:
+    def __init__(self, path=LOG_PATH, max_bytes=MAX_BYTES, backups=BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = queue.Queue()
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+    def append(self, entry):
+        """Queue an entry; it reaches the disk with the next batch."""
+        self.queue.put(entry)
+        self.ensure_writer()
+
+    def ensure_writer(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.thread_lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name='interaction-log', daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                entry = self.queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = []
+            while entry is not _STOP:
+                batch.append(entry)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self.write(batch)
+            if entry is _STOP:
+                return
+
+    def close(self, timeout=10):
+        """
+        Stop the writer once it has written everything queued before the
+        call, then write whatever is still queued; registered with atexit.
+        Joining matters because the writer is a daemon thread: a batch it
+        has taken off the queue but not yet written would otherwise be lost
+        when the interpreter exits.
+        """
+        with self.thread_lock:
+            thread = self.thread
+            if thread is not None and thread.is_alive():
+                self.queue.put(_STOP)
+                thread.join(timeout)
+                if thread.is_alive():
+                    return
+            batch = []
+            while True:
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is not _STOP:
+                    batch.append(entry)
+            if batch:
+                self.write(batch)
+
+    def write(self, batch):
+        data = "".join(json.dumps(entry) + "\n" for entry in batch).encode('utf-8')
+        try:
+            with self.write_lock, self.process_lock():
+                self.rotate_if_needed()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+        except OSError as e:
+            print(f"Error logging interaction: {e}")
+
+    def process_lock(self):
+        return _FileLock(self.path + '.lock')
+
+    def rotate_if_needed(self):
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except FileNotFoundError:
+            return
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def files(self):
+        """Log files from oldest to newest."""
+        rotated = [f"{self.path}.{index}" for index in range(self.backups, 0, -1)]
+        return [path for path in rotated + [self.path] if os.path.exists(path)]
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+def read_interactions(log=None):
+    """Yield logged entries oldest first, skipping lines cut short by a crash."""
+    log = log or interaction_log
+    for path in log.files():
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            # Rotated away by another process while we were reading
+            continue
+
+
+interaction_log = InteractionLog()
+atexit.register(interaction_log.close)
@@ -0,0 +1,138 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .cache import invalidate_dashboard_summaries, invalidate_dashboard_summary
+from .models import Payment, Transaction, UserLedger
+
+LEDGER_FIELDS = ['total_paid', 'total_received', 'policy_payment_count', 'claim_payout_count']
+
+
+def legacy_payouts():
+    """Paid Payments whose claim never got a Claim Payout Transaction."""
+    payout_transactions = Transaction.objects.filter(
+        user=OuterRef('claim__claimant'),
+        transaction_type="Claim Payout",
+        claim=OuterRef('claim')
+    )
+    return Payment.objects.filter(is_paid=True).exclude(Exists(payout_transactions))
+
+
+def compute_ledger_totals(user_ids):
+    """Recompute ledger figures from the raw Transaction and Payment rows."""
+    totals = {
+        user_id: {
+            'total_paid': Decimal('0'),
+            'total_received': Decimal('0'),
+            'policy_payment_count': 0,
+            'claim_payout_count': 0,
+        }
+        for user_id in user_ids
+    }
+
+    transaction_rows = Transaction.objects.filter(user_id__in=user_ids).values('user_id').annotate(
+        paid=Sum('amount', filter=Q(transaction_type="Policy Payment")),
+        received=Sum('amount', filter=Q(transaction_type="Claim Payout")),
+        payments=Count('id', filter=Q(transaction_type="Policy Payment")),
+        payouts=Count('id', filter=Q(transaction_type="Claim Payout"))
+    ).order_by()
+    for row in transaction_rows:
+        entry = totals[row['user_id']]
+        entry['total_paid'] += row['paid'] or 0
+        entry['total_received'] += row['received'] or 0
+        entry['policy_payment_count'] += row['payments']
+        entry['claim_payout_count'] += row['payouts']
+
+    legacy_rows = legacy_payouts().filter(claim__claimant_id__in=user_ids).values('claim__claimant_id').annotate(
+        received=Sum('amount'),
+        payouts=Count('id')
+    ).order_by()
+    for row in legacy_rows:
+        entry = totals[row['claim__claimant_id']]
+        entry['total_received'] += row['received'] or 0
+        entry['claim_payout_count'] += row['payouts']
+
+    return totals
+
+
+def rebuild_ledger(user_id):
+    totals = compute_ledger_totals([user_id])[user_id]
+    ledger, _ = UserLedger.objects.update_or_create(user_id=user_id, defaults=totals)
+    return ledger
+
+
+def get_ledger(user):
+    """Return the user's ledger, building it from history on first access."""
+    try:
+        return UserLedger.objects.get(user=user)
+    except UserLedger.DoesNotExist:
+        return rebuild_ledger(user.id)
+
+
+def apply_to_ledger(user_id, **deltas):
+    """
+    Add deltas to the user's ledger in a single UPDATE.
+
+    Call this inside the same atomic block that writes the Transaction or
+    Payment rows. A user without a ledger row gets one rebuilt from the raw
+    tables instead, which already includes the rows just written.
+    """
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    updated = UserLedger.objects.filter(user_id=user_id).update(updated_at=timezone.now(), **changes)
+    if not updated:
+        rebuild_ledger(user_id)
+    # Drop summaries cached between the row write and this commit
+    transaction.on_commit(lambda: invalidate_dashboard_summary(user_id))
+
+
+def record_policy_payment(user_id, amount):
+    apply_to_ledger(user_id, total_paid=Decimal(str(amount)), policy_payment_count=1)
+
+
+def record_claim_payout(user_id, amount):
+    apply_to_ledger(user_id, total_received=Decimal(str(amount)), claim_payout_count=1)
+
+
+def apply_to_ledgers(amounts, total_field, count_field):
+    """
+    Bulk form of apply_to_ledger for {user_id: [amount, ...]}.
+
+    Every ledger gets the same relative UPDATE apply_to_ledger runs, sent as
+    one executemany rather than a query per user. Call it inside the atomic
+    block that writes the rows.
+    """
+    existing = set(UserLedger.objects.filter(user_id__in=amounts).values_list('user_id', flat=True))
+    table = connection.ops.quote_name(UserLedger._meta.db_table)
+    total = UserLedger._meta.get_field(total_field)
+    count = UserLedger._meta.get_field(count_field)
+    now = UserLedger._meta.get_field('updated_at').get_db_prep_save(timezone.now(), connection)
+    rows = [
+        (total.get_db_prep_save(sum(Decimal(str(amount)) for amount in user_amounts), connection), len(user_amounts), now, user_id)
+        for user_id, user_amounts in amounts.items()
+        if user_id in existing
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {table} SET {total.column} = {total.column} + %s, "
+            f"{count.column} = {count.column} + %s, updated_at = %s WHERE user_id = %s",
+            rows
+        )
+    missing = [user_id for user_id in amounts if user_id not in existing]
+    if missing:
+        # Built from the raw tables, which already hold the rows just written
+        UserLedger.objects.bulk_create(
+            [UserLedger(user_id=user_id, **totals) for user_id, totals in compute_ledger_totals(missing).items()],
+            update_conflicts=True, unique_fields=['user'], update_fields=LEDGER_FIELDS
+        )
+    user_ids = list(amounts)
+    transaction.on_commit(lambda: invalidate_dashboard_summaries(user_ids))
+
+
+def record_policy_payments(payments):
+    apply_to_ledgers(payments, 'total_paid', 'policy_payment_count')
+
+
+def record_claim_payouts(payouts):
+    apply_to_ledgers(payouts, 'total_received', 'claim_payout_count')
@@ -0,0 +1,113 @@
+"""
+Lazily created Groq clients and the chatbot's LLM concurrency limits.
+
+Nothing here touches the network or imports the groq SDK until a chat
+actually needs a client, so workers, management commands and tests that
+never chat do not pay for the LLM stack. Call prewarm() after forking (see
+CHATBOT_PREWARM in apps.py) to move that cost off the first request.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
+
+# Seconds to wait for the LLM, and for a free slot when too many chats are in flight
+LLM_TIMEOUT = float(os.getenv('CHATBOT_LLM_TIMEOUT', '30'))
+LLM_QUEUE_TIMEOUT = float(os.getenv('CHATBOT_QUEUE_TIMEOUT', '5'))
+LLM_MAX_CONCURRENCY = int(os.getenv('CHATBOT_MAX_CONCURRENCY', '16'))
+
+
+class ChatbotBusyError(Exception):
+    """Raised when no LLM slot frees up within LLM_QUEUE_TIMEOUT."""
+
+
+# Initialize Groq client with error handling
+def get_groq_client(asynchronous=False):
+    # Try to get API key from environment
+    api_key = os.getenv('GROQ_API_KEY')
+
+    print(f"🔍 Environment API Key: {'Found' if api_key else 'Not Found'}")
+
+    if not api_key:
+        print("❌ GROQ_API_KEY environment variable not set")
+        print("Please set it with: export GROQ_API_KEY=your_api_key_here")
+        return None
+
+    try:
+        from groq import AsyncGroq, Groq
+
+        client_class = AsyncGroq if asynchronous else Groq
+        client = client_class(api_key=api_key, timeout=LLM_TIMEOUT, max_retries=0)
+        print(f"✅ {client_class.__name__} client initialized successfully")
+        return client
+    except Exception as e:
+        print(f"❌ Error initializing Groq client: {e}")
+        return None
+
+
+_client = None
+_client_created = False
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide sync client, created on first use; None without an API key."""
+    global _client, _client_created
+    if not _client_created:
+        with _client_lock:
+            if not _client_created:
+                _client = get_groq_client()
+                _client_created = True
+    return _client
+
+
+def reset_clients():
+    """Forget the sync client, e.g. after the API key changed."""
+    global _client, _client_created
+    with _client_lock:
+        _client = None
+        _client_created = False
+
+
+# The async client and its concurrency limit belong to one event loop each
+_async_clients = weakref.WeakKeyDictionary()
+_llm_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = get_groq_client(asynchronous=True)
+    return _async_clients[loop]
+
+
+def get_llm_semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in _llm_semaphores:
+        _llm_semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _llm_semaphores[loop]
+
+
+@asynccontextmanager
+async def llm_slot():
+    """
+    Hold one of the LLM_MAX_CONCURRENCY completion slots of this event loop.
+
+    Callers that cannot get a slot within LLM_QUEUE_TIMEOUT get
+    ChatbotBusyError instead of piling up.
+    """
+    semaphore = get_llm_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), LLM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ChatbotBusyError()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def prewarm():
+    """Import the SDK and build the sync client now instead of on the first chat."""
+    get_client()
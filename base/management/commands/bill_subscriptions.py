@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from base.billing import CHUNK_SIZE, bill_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Charge the monthly premium for every subscription month that has started. Safe to rerun."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Bill as of this date (YYYY-MM-DD) instead of today.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes to split the subscriptions between.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            today = parse_date(options['date'])
+            if today is None:
+                raise CommandError("--date must be YYYY-MM-DD.")
+
+        read, charged = bill_subscriptions(today, options['workers'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Charged {charged} monthly premiums across {read} subscriptions."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from base.chat_sessions import MemorySessionStore, get_session_store
+
+
+class Command(BaseCommand):
+    help = "Report chatbot session store metrics, optionally purging expired sessions first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge', action='store_true',
+                            help='Evict expired sessions and enforce the size caps before reporting.')
+
+    def handle(self, *args, **options):
+        store = get_session_store()
+        if options['purge']:
+            evicted = store.purge()
+            self.stdout.write(f"Evicted {evicted} sessions.")
+
+        stats = store.stats()
+        self.stdout.write(f"Store: {type(store).__name__}")
+        self.stdout.write(f"Sessions: {stats['sessions']}")
+        self.stdout.write(f"Bytes: {stats['bytes']}")
+        if isinstance(store, MemorySessionStore):
+            # Other stores are shared between processes, so a per-process count would mislead
+            self.stdout.write(f"Evictions: {stats['evictions']}")
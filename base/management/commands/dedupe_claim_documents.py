@@ -0,0 +1,55 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from base.models import ClaimDocument, DocumentBlob
+from base.storage import blob_name, claim_document_storage
+
+
+class Command(BaseCommand):
+    help = "Move claim documents stored by filename into content-addressed blobs, or verify the blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Rehash every blob and fail if any is missing or corrupted.')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self.verify()
+
+        storage = claim_document_storage()
+        moved = missing = 0
+        for document in ClaimDocument.objects.filter(sha256='').iterator():
+            old_name = document.file.name
+            if not storage.exists(old_name):
+                missing += 1
+                continue
+            with storage.open(old_name, 'rb') as file:
+                new_name = storage.save(old_name, file)
+
+            with transaction.atomic():
+                document.filename = document.filename or os.path.basename(old_name)
+                document.file.name = new_name
+                document.size = storage.size(new_name)
+                # post_save counts the new blob reference
+                document.save(update_fields=['file', 'filename', 'sha256', 'size'])
+            if not ClaimDocument.objects.filter(file=old_name).exists():
+                storage.delete(old_name)
+            moved += 1
+
+        self.stdout.write(f"Moved {moved} documents into blobs, {missing} files were missing.")
+
+    def verify(self):
+        storage = claim_document_storage()
+        broken = []
+        for digest in DocumentBlob.objects.values_list('sha256', flat=True).iterator():
+            name = blob_name(digest)
+            if not storage.exists(name) or not storage.verify(name):
+                broken.append(digest)
+
+        for digest in broken:
+            self.stderr.write(f"Blob {digest} is missing or does not match its hash.")
+        if broken:
+            raise CommandError(f"{len(broken)} blobs failed verification.")
+        self.stdout.write("All blobs verified.")
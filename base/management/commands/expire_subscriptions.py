@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from base.expiry import CHUNK_SIZE, expire_subscriptions
+
+
+class Command(BaseCommand):
+    help = "Mark fully billed Active subscriptions whose expiry_date has passed as Complete."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Expire as of this date (YYYY-MM-DD) instead of today.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            today = parse_date(options['date'])
+            if today is None:
+                raise CommandError("--date must be YYYY-MM-DD.")
+
+        expired = expire_subscriptions(today, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} subscriptions."))
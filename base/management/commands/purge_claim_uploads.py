@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from base.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete unfinished claim document uploads idle for longer than CLAIM_UPLOADS['TTL']."
+
+    def handle(self, *args, **options):
+        purged = purge_stale_uploads()
+        self.stdout.write(f"Purged {purged} stale uploads.")
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from base.ledger import LEDGER_FIELDS, compute_ledger_totals
+from base.models import UserLedger
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or with --verify, check) every user's ledger from the Transaction and Payment tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Report ledgers that drift from the raw tables without writing.')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Limit to this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        checked = mismatched = 0
+
+        for user_ids in self.user_batches(options['user_ids'], options['batch_size']):
+            if verify:
+                mismatched += self.verify(user_ids)
+            else:
+                self.rebuild(user_ids)
+            checked += len(user_ids)
+
+        if verify and mismatched:
+            raise CommandError(f"{mismatched} of {checked} ledgers differ from the raw tables.")
+        action = 'Verified' if verify else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(f"{action} {checked} ledgers."))
+
+    def verify(self, user_ids):
+        """Report drifting ledgers in this batch; return how many."""
+        totals = compute_ledger_totals(user_ids)
+        ledgers = UserLedger.objects.in_bulk(user_ids, field_name='user_id')
+        mismatched = 0
+        for user_id, expected in totals.items():
+            ledger = ledgers.get(user_id)
+            if ledger is None:
+                # A missing ledger is built lazily on first read
+                continue
+            drift = {
+                field: (getattr(ledger, field), expected[field])
+                for field in LEDGER_FIELDS
+                if getattr(ledger, field) != expected[field]
+            }
+            if drift:
+                mismatched += 1
+                self.stdout.write(f"user {user_id}: " + ", ".join(
+                    f"{field} is {stored}, expected {actual}" for field, (stored, actual) in drift.items()
+                ))
+        return mismatched
+
+    def rebuild(self, user_ids):
+        with transaction.atomic():
+            # Lock the ledgers before reading the raw tables: an apply_to_ledger
+            # increment from a write committing meanwhile then waits and lands
+            # on top of the rebuilt totals instead of being overwritten by them
+            list(UserLedger.objects.select_for_update().filter(user_id__in=user_ids).values_list('id', flat=True))
+            totals = compute_ledger_totals(user_ids)
+            # Upsert in place, so ledgers never disappear for concurrent readers
+            UserLedger.objects.bulk_create(
+                [UserLedger(user_id=user_id, **expected) for user_id, expected in totals.items()],
+                update_conflicts=True, unique_fields=['user'], update_fields=LEDGER_FIELDS + ['updated_at']
+            )
+
+    def user_batches(self, user_ids, batch_size):
+        users = User.objects.order_by('id')
+        if user_ids:
+            users = users.filter(id__in=user_ids)
+
+        last_id = 0
+        while True:
+            batch = list(users.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1 on 2026-10-17 00:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_remove_insurancepolicy_duration'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['claimant', 'status'], name='claim_claimant_status'),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['-claim_date', '-id'], name='claim_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['claimant', '-claim_date', '-id'], name='claim_claimant_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('is_paid', True)), fields=['claim'], name='payment_paid_claim'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'transaction_type', '-timestamp'], name='tx_user_type_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='userpolicies',
+            index=models.Index(fields=['user', 'policy', 'status'], name='userpol_user_policy_status'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1 on 2026-10-17 00:32
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_chatsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claimdocument',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0, help_text='file size in bytes'),
+        ),
+        migrations.CreateModel(
+            name='ClaimUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(help_text='declared file size in bytes')),
+                ('sha256', models.CharField(blank=True, help_text='optional checksum to verify on finalize', max_length=64)),
+                ('received', models.PositiveBigIntegerField(default=0, help_text='bytes stored so far, always a prefix')),
+                ('status', models.CharField(choices=[('Uploading', 'Uploading'), ('Complete', 'Complete')], default='Uploading', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('claim', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='base.claim')),
+                ('document', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='base.claimdocument')),
+            ],
+        ),
+    ]
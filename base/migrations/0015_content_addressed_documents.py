@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-17 00:35
+
+import base.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_claimupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='claimdocument',
+            name='filename',
+            field=models.CharField(blank=True, help_text='name the file was uploaded under', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='claimdocument',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='claimdocument',
+            name='file',
+            field=models.FileField(storage=base.storage.claim_document_storage, upload_to='claim_documents/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_content_addressed_documents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claimdocument',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, help_text='thumbnail/preview storage names, see base/derivatives.py'),
+        ),
+    ]
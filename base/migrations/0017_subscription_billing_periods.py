@@ -0,0 +1,49 @@
+# Generated by Django 5.1 on 2026-10-17 00:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def number_existing_payments(apps, schema_editor):
+    """Treat each subscription's existing Policy Payments as its first months."""
+    Transaction = apps.get_model('base', 'Transaction')
+    UserPolicies = apps.get_model('base', 'UserPolicies')
+
+    payments = Transaction.objects.filter(transaction_type="Policy Payment").order_by(
+        'policy_subscription_id', 'timestamp', 'id'
+    ).values_list('id', 'policy_subscription_id')
+    numbered, billed = [], {}
+    for transaction_id, subscription_id in payments.iterator(chunk_size=2000):
+        billed[subscription_id] = billed.get(subscription_id, 0) + 1
+        numbered.append(Transaction(id=transaction_id, billing_period=billed[subscription_id]))
+    Transaction.objects.bulk_update(numbered, ['billing_period'], batch_size=500)
+    UserPolicies.objects.bulk_update(
+        [UserPolicies(id=subscription_id, periods_billed=count) for subscription_id, count in billed.items()],
+        ['periods_billed'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0016_claimdocument_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='billing_period',
+            field=models.PositiveIntegerField(blank=True, help_text='month of the subscription a Policy Payment covers, from 1', null=True),
+        ),
+        migrations.AddField(
+            model_name='userpolicies',
+            name='periods_billed',
+            field=models.PositiveIntegerField(default=0, help_text='monthly premiums charged so far, see base/billing.py'),
+        ),
+        migrations.RunPython(number_existing_payments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('billing_period__isnull', False)), fields=('policy_subscription', 'billing_period'), name='tx_subscription_billing_period'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-17 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0017_subscription_billing_periods'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userpolicies',
+            index=models.Index(fields=['status', 'expiry_date'], name='userpol_status_expiry'),
+        ),
+    ]
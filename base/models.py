@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
+import os
 import uuid
 
+from .storage import blob_digest, claim_document_storage
+
 class Category(models.Model):
     name = models.CharField(max_length=30, unique=True)
     created_date = models.DateField(auto_now_add=True)
@@ -62,6 +65,15 @@ class UserPolicies(models.Model):
     creation_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=[('Active', 'Active'), ('On Pause', 'On Pause'), ('Complete', 'Complete')], default='Active')
     expiry_date = models.DateField(null=True, blank=True)  
+    periods_billed = models.PositiveIntegerField(default=0, help_text="monthly premiums charged so far, see base/billing.py")
+
+    class Meta:
+        indexes = [
+            # Subscription lookups in submit_claim, list_claims and process_claim
+            models.Index(fields=['user', 'policy', 'status'], name='userpol_user_policy_status'),
+            # The expiry sweep, see base/expiry.py
+            models.Index(fields=['status', 'expiry_date'], name='userpol_status_expiry'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.policy.name}"
@@ -82,6 +94,15 @@ class Claim(models.Model):
     claim_date = models.DateTimeField(auto_now_add=True)
     approval_date = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Dashboard counts per claimant and status
+            models.Index(fields=['claimant', 'status'], name='claim_claimant_status'),
+            # Keyset pagination order for the claim lists
+            models.Index(fields=['-claim_date', '-id'], name='claim_date_id'),
+            models.Index(fields=['claimant', '-claim_date', '-id'], name='claim_claimant_date_id'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.claim_number:
              self.claim_number = f"CLM-{uuid.uuid4().hex[:8].upper()}"  # Short UUID for auto generated claim number 
@@ -105,6 +126,21 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     momo_number = models.CharField(max_length=20)
     timestamp = models.DateTimeField(auto_now_add=True)
+    billing_period = models.PositiveIntegerField(null=True, blank=True, help_text="month of the subscription a Policy Payment covers, from 1")
+
+    class Meta:
+        indexes = [
+            # Per-user history and totals filtered by type, newest first
+            models.Index(fields=['user', 'transaction_type', '-timestamp'], name='tx_user_type_timestamp'),
+        ]
+        constraints = [
+            # Each month of a subscription is charged at most once
+            models.UniqueConstraint(
+                fields=['policy_subscription', 'billing_period'],
+                condition=models.Q(billing_period__isnull=False),
+                name='tx_subscription_billing_period'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - {self.amount}"
@@ -112,6 +148,21 @@ class Transaction(models.Model):
 
 
 
+class UserLedger(models.Model):
+    """Running financial totals per user, kept in step with Transaction/Payment writes."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='ledger')
+    total_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_received = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    policy_payment_count = models.PositiveIntegerField(default=0)
+    claim_payout_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Ledger for {self.user.username}"
+
+
+
+
 class Messages(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
@@ -130,6 +181,12 @@ class Payment(models.Model):
     payment_date = models.DateField(auto_now_add=True)
     is_paid = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Payout lookups only ever join paid payments to their claims
+            models.Index(fields=['claim'], condition=models.Q(is_paid=True), name='payment_paid_claim'),
+        ]
+
     def __str__(self):
         return f"Payment of {self.amount} for {self.claim.claim_number}"
 
@@ -137,8 +194,74 @@ class Payment(models.Model):
 
 class ClaimDocument(models.Model):
     claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='documents')
-    file = models.FileField(upload_to='claim_documents/')
+    file = models.FileField(upload_to='claim_documents/', storage=claim_document_storage)
+    filename = models.CharField(max_length=255, blank=True, help_text="name the file was uploaded under")
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.PositiveBigIntegerField(default=0, help_text="file size in bytes")
+    derivatives = models.JSONField(default=dict, blank=True, help_text="thumbnail/preview storage names, see base/derivatives.py")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        content = None
+        if self.file and not self.file._committed:
+            # Commit the file first so the row gets its content hash
+            content = self.file.file
+            self.filename = self.filename or os.path.basename(self.file.name)[:255]
+            self.file.save(self.file.name, content, save=False)
+            if not self._state.adding:
+                # New content, so the old thumbnails no longer apply
+                self.derivatives = {}
+        self.sha256 = blob_digest(self.file.name) or self.sha256
+        super().save(*args, **kwargs)
+        # post_save has counted the reference; if the blob was collected after
+        # the storage found it present, write it back from the content
+        if content is not None and not self.file.storage.exists(self.file.name):
+            self.file.storage.save(self.file.name, content)
+
     def __str__(self):
         return f"Document for {self.claim.claim_number}"
+
+
+class DocumentBlob(models.Model):
+    """A stored file shared by every ClaimDocument with the same content."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.ref_count} refs)"
+
+
+class ClaimUpload(models.Model):
+    """A resumable claim document upload, see base/uploads.py."""
+    STATUS_CHOICES = [
+        ('Uploading', 'Uploading'),
+        ('Complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    claim = models.ForeignKey(Claim, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(help_text="declared file size in bytes")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="optional checksum to verify on finalize")
+    received = models.PositiveBigIntegerField(default=0, help_text="bytes stored so far, always a prefix")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Uploading')
+    document = models.OneToOneField(ClaimDocument, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} for {self.claim.claim_number}"
+
+
+
+class ChatSession(models.Model):
+    """Chatbot conversation history, see base.chat_sessions.DatabaseSessionStore."""
+    session_id = models.CharField(max_length=64, unique=True)
+    history = models.JSONField(default=list)
+    size = models.PositiveIntegerField(default=0, help_text="serialized history size in bytes")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Chat session {self.session_id}"
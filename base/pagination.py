@@ -0,0 +1,131 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import DateTimeField, Q, Value
+from django.db.models.functions import Cast
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a (timestamp, unique key) pair, newest first.
+
+    Each page continues strictly after the last row of the previous one, so
+    pages stay cheap no matter how deep the client scrolls (no OFFSET scans).
+    """
+    ordering_field = None
+    tiebreak_field = 'id'
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = self.filter_after(queryset, position)
+        return self.get_page(queryset.order_by(*self.get_ordering()))
+
+    def get_ordering(self):
+        return (f'-{self.ordering_field}', f'-{self.tiebreak_field}')
+
+    def filter_after(self, queryset, position):
+        """Restrict the queryset to rows that sort after the cursor position."""
+        if position is None:
+            return queryset
+        timestamp, key = position
+        timestamp = self.get_cursor_value(timestamp)
+        return queryset.filter(
+            Q(**{f'{self.ordering_field}__lt': timestamp}) |
+            Q(**{self.ordering_field: timestamp, f'{self.tiebreak_field}__lt': key})
+        )
+
+    def get_cursor_value(self, timestamp):
+        return timestamp
+
+    def get_page(self, queryset):
+        # Fetch one extra row to know whether another page exists
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        self.next_position = None
+        if self.has_next:
+            last = results[-1]
+            if isinstance(last, dict):
+                self.next_position = (last[self.ordering_field], last[self.tiebreak_field])
+            else:
+                self.next_position = (getattr(last, self.ordering_field), getattr(last, self.tiebreak_field))
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        timestamp, key = position
+        raw = f"{timestamp.isoformat()}|{key}"
+        return urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            raw = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            timestamp, key = raw.split('|')
+            return datetime.fromisoformat(timestamp), int(key)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ClaimPagination(KeysetPagination):
+    ordering_field = 'claim_date'
+
+
+class TransactionFeedPagination(KeysetPagination):
+    """
+    Keyset pagination over a UNION of row sources.
+
+    Each source is filtered past the cursor before the UNION, since Django
+    cannot filter a combined queryset. Sources must expose a `sort_timestamp`
+    cast to DateTimeField and a `sort_key` that is unique across all of them.
+    """
+    ordering_field = 'sort_timestamp'
+    tiebreak_field = 'sort_key'
+
+    def get_cursor_value(self, timestamp):
+        # Cast the cursor the same way as the sources so DATE and DATETIME
+        # rows compare in one representation on every backend
+        return Cast(Value(timestamp, output_field=DateTimeField()), DateTimeField())
+
+    def paginate_union(self, querysets, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        first, *rest = [self.filter_after(queryset, position) for queryset in querysets]
+        combined = first.union(*rest, all=True)
+        return self.get_page(combined.order_by(*self.get_ordering()))
@@ -0,0 +1,98 @@
+"""
+Cache of first-turn chatbot replies keyed on normalized user input.
+
+Opening questions repeat a lot across users, and the first turn of a session
+only depends on the system prompt and the message, so its reply can be
+reused. Entries remember the catalog version they were built against (see
+cache.catalog_version) and are dropped once the policy catalog changes, since
+they carry the policies shown with the reply.
+"""
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .cache import catalog_version
+
+MAX_ENTRIES = int(os.getenv('CHATBOT_RESPONSE_CACHE_SIZE', '2000'))
+TTL = float(os.getenv('CHATBOT_RESPONSE_CACHE_TTL', str(60 * 60 * 6)))
+# Also match messages with the same words in a different order or with filler words
+FUZZY = os.getenv('CHATBOT_RESPONSE_CACHE_FUZZY', 'false').lower() == 'true'
+
+FILLER_WORDS = {"a", "an", "the", "please", "hi", "hello", "hey", "um", "so", "just", "pls", "plz"}
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def fuzzy_key(text):
+    words = set(normalize(text).split()) - FILLER_WORDS
+    return " ".join(sorted(words))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL, fuzzy=FUZZY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fuzzy = fuzzy
+        self.lock = threading.Lock()
+        # key -> (value, catalog version, stored_at)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def keys_for(self, text):
+        keys = [normalize(text)]
+        if self.fuzzy:
+            keys.append("~" + fuzzy_key(text))
+        return keys
+
+    def get(self, text):
+        version = catalog_version()
+        with self.lock:
+            for key in self.keys_for(text):
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                value, entry_version, stored_at = entry
+                if entry_version != version or time.monotonic() - stored_at > self.ttl:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(value)
+            self.misses += 1
+            return None
+
+    def set(self, text, value):
+        version = catalog_version()
+        value = copy.deepcopy(value)
+        with self.lock:
+            for key in self.keys_for(text):
+                if not key.strip("~"):
+                    continue
+                self.entries[key] = (value, version, time.monotonic())
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache()
@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from .models import (
-  UserPolicies, Category, Company, InsurancePolicy, Claim,  Messages, Payment, User, Transaction
+  UserPolicies, Category, Company, InsurancePolicy, Claim,  Messages, Payment, User, Transaction, ClaimDocument
 )
 from django.contrib.auth.models import Group
+from django.urls import reverse
+from .derivatives import UNSUPPORTED, is_image
+import os
 
 
 
@@ -76,6 +79,60 @@ class ClaimSerializer(serializers.ModelSerializer):
         ]
 
 
+class ClaimDocumentSerializer(serializers.ModelSerializer):
+    file_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
+    filename = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ClaimDocument
+        fields = ['id', 'file_url', 'thumbnail_url', 'preview_url', 'filename', 'uploaded_at']
+
+    def absolute_url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_file_url(self, doc):
+        return self.absolute_url(reverse('claim-document', args=[doc.id]))
+
+    def derivative_url(self, doc, variant):
+        # The view renders derivatives the pool has not got to yet
+        if doc.derivatives.get(UNSUPPORTED) or not is_image(doc):
+            return None
+        return self.absolute_url(reverse('claim-document-derivative', args=[doc.id, variant]))
+
+    def get_thumbnail_url(self, doc):
+        return self.derivative_url(doc, 'thumbnail')
+
+    def get_preview_url(self, doc):
+        return self.derivative_url(doc, 'preview')
+
+    def get_filename(self, doc):
+        return doc.filename or os.path.basename(doc.file.name)
+
+
+class ClaimListSerializer(ClaimSerializer):
+    # Expects claimant/policy joined and documents prefetched by the view;
+    # plan types come in through context as {(claimant_id, policy_id): plan_type}
+    claimant_email = serializers.EmailField(source='claimant.email', read_only=True)
+    policy_name = serializers.CharField(source='policy.name', read_only=True)
+    policy_type = serializers.SerializerMethodField()
+    documents = ClaimDocumentSerializer(many=True, read_only=True)
+
+    class Meta(ClaimSerializer.Meta):
+        fields = ClaimSerializer.Meta.fields + [
+            'claimant_email',
+            'policy_name',
+            'policy_type',
+            'documents',
+        ]
+
+    def get_policy_type(self, claim):
+        plan_types = self.context.get('plan_types', {})
+        return plan_types.get((claim.claimant_id, claim.policy_id), 'Unknown')
+
+
 
 
 class MessagesSerializer(serializers.ModelSerializer):
@@ -0,0 +1,93 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token, forget_user_tokens
+from .cache import invalidate_catalog, invalidate_dashboard_summaries, invalidate_dashboard_summary
+from .derivatives import schedule_derivatives
+from .expiry import subscriptions_expired
+from .storage import release_blob, retain_blob
+from .models import Category, Claim, ClaimDocument, Company, InsurancePolicy, Transaction, UserPolicies
+
+
+@receiver([post_save, post_delete], sender=UserPolicies)
+@receiver([post_save, post_delete], sender=Transaction)
+def invalidate_user_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard_summary(instance.user_id)
+
+
+@receiver(subscriptions_expired)
+def invalidate_expired_dashboards(sender, user_ids, **kwargs):
+    invalidate_dashboard_summaries(user_ids)
+
+
+@receiver([post_save, post_delete], sender=Claim)
+def invalidate_claimant_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard_summary(instance.claimant_id)
+
+
+@receiver([post_save, post_delete], sender=InsurancePolicy)
+@receiver([post_save, post_delete], sender=Company)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(pre_save, sender=ClaimDocument)
+def remember_previous_blob(sender, instance, **kwargs):
+    instance._previous_sha256 = ''
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_sha256 = sender.objects.filter(pk=instance.pk).values_list('sha256', flat=True).first() or ''
+
+
+@receiver(post_save, sender=ClaimDocument)
+def count_blob_reference(sender, instance, created, **kwargs):
+    # A replaced file moves the reference from the old blob to the new one
+    previous = getattr(instance, '_previous_sha256', '')
+    if instance.sha256 == previous:
+        return
+    if instance.sha256:
+        retain_blob(instance.sha256, instance.size)
+    if previous:
+        release_blob(previous)
+
+
+@receiver(post_save, sender=ClaimDocument)
+def render_document_derivatives(sender, instance, created, **kwargs):
+    if created or not instance.derivatives:
+        schedule_derivatives(instance)
+
+
+@receiver(post_delete, sender=ClaimDocument)
+def drop_blob_reference(sender, instance, **kwargs):
+    if instance.sha256:
+        release_blob(instance.sha256)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_saved_user_tokens(sender, instance, **kwargs):
+    forget_user_tokens([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def forget_regrouped_user_tokens(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            forget_user_tokens([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        forget_user_tokens(pk_set)
+    elif action == 'pre_clear':
+        # The members are gone by post_clear
+        forget_user_tokens(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def forget_group_member_tokens(sender, instance, **kwargs):
+    forget_user_tokens(instance.user_set.values_list('pk', flat=True))
@@ -0,0 +1,128 @@
+"""
+Content-addressed storage for claim documents.
+
+Files are hashed while they are written and stored once under their SHA-256
+(claim_documents/blobs/ab/abcdef...), so a receipt uploaded to ten claims
+takes the disk space of one. DocumentBlob counts how many ClaimDocuments
+point at each blob (see signals.py) and the blob file is deleted when the
+last one goes. Names written before this storage existed still resolve as
+plain paths under MEDIA_ROOT.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+BLOB_DIR = 'claim_documents/blobs'
+BLOB_NAME = re.compile(r"^claim_documents/blobs/[0-9a-f]{2}/([0-9a-f]{64})$")
+
+
+def blob_name(digest):
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}"
+
+
+def blob_digest(name):
+    """The SHA-256 a stored name was derived from, or None for legacy names."""
+    match = BLOB_NAME.match(name or '')
+    return match.group(1) if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        # Callers that already hashed the content (e.g. finalized uploads)
+        # set content.sha256 and skip the write entirely for known blobs
+        digest = getattr(content, 'sha256', None)
+        if digest and self.exists(blob_name(digest)):
+            return blob_name(digest)
+
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            sha256 = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as blob:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    blob.write(chunk)
+
+            name = blob_name(sha256.hexdigest())
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    def verify(self, name):
+        """Rehash a blob and check it still matches its name."""
+        digest = blob_digest(name)
+        if digest is None:
+            return None
+        sha256 = hashlib.sha256()
+        with self.open(name, 'rb') as blob:
+            for chunk in blob.chunks():
+                sha256.update(chunk)
+        return sha256.hexdigest() == digest
+
+
+def retain_blob(digest, size):
+    """
+    Count one more reference to a blob, under its row lock.
+
+    Once this commits, delete_unreferenced_blob sees a non-zero count and
+    leaves the file alone. A collection that finished just before can still
+    have removed the file, so callers holding the content check for it
+    afterwards (see ClaimDocument.save).
+    """
+    from .models import DocumentBlob
+
+    with transaction.atomic():
+        DocumentBlob.objects.get_or_create(sha256=digest, defaults={'size': size})
+        if not DocumentBlob.objects.select_for_update().filter(sha256=digest).exists():
+            # Collected between the two statements
+            DocumentBlob.objects.create(sha256=digest, size=size)
+        DocumentBlob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+
+
+def release_blob(digest):
+    from .models import DocumentBlob
+
+    DocumentBlob.objects.filter(sha256=digest, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: delete_unreferenced_blob(digest))
+
+
+def delete_unreferenced_blob(digest):
+    from .derivatives import delete_derivatives
+    from .models import DocumentBlob
+
+    with transaction.atomic():
+        blob = DocumentBlob.objects.select_for_update().filter(sha256=digest).first()
+        # Re-checked under the lock: a retain_blob may have won the race
+        if blob is None or blob.ref_count:
+            return
+        blob.delete()
+        # Unlinked before the row delete commits, so no retain can see the
+        # row gone while the file is still about to disappear
+        claim_document_storage().delete(blob_name(digest))
+        delete_derivatives(digest)
+
+
+_storage = None
+
+
+def claim_document_storage():
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
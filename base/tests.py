@@ -1,3 +1,1442 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import ai_logic, derivatives, intent, llm, signals
+from .authentication import CachedTokenAuthentication, token_cache_key
+from .billing import bill_subscriptions, periods_due
+from .cache import dashboard_summary_key
+from .expiry import expire_subscriptions
+from .categories import CategoryResolver, resolve_category
+from .chat_sessions import DatabaseSessionStore, MemorySessionStore, SessionStore, get_session_store
+from .history import HISTORY_TOKENS, history_tokens, is_summary
+from .interaction_log import InteractionLog, read_interactions
+from .intent import IntentClassifier, load_training_data
+from .ledger import rebuild_ledger
+from .serializers import ClaimDocumentSerializer
+from .storage import blob_name, delete_unreferenced_blob
+from .response_cache import ResponseCache, normalize
+from .models import Category, ChatSession, Claim, ClaimDocument, ClaimUpload, DocumentBlob, Company, InsurancePolicy, Payment, Transaction, UserLedger, UserPolicies
+
+
+def create_policy(admin, category_name='Auto', name='Drive Safe'):
+    category, _ = Category.objects.get_or_create(name=category_name)
+    company = Company.objects.create(
+        company_category=category,
+        admin=admin,
+        name=f"{name} Co",
+        description="Test company",
+    )
+    return InsurancePolicy.objects.create(
+        company=company,
+        category=category,
+        name=name,
+        description="Test policy",
+        premium_coverage_amount=Decimal('10000.00'),
+        regular_coverage_amount=Decimal('5000.00'),
+        premium=Decimal('100.00'),
+        regular=Decimal('50.00'),
+    )
+
+
+def seed_claims(claimants, policy, count):
+    start = Claim.objects.count()
+    Claim.objects.bulk_create([
+        Claim(
+            policy=policy,
+            title=f"Claim {start + i}",
+            claimant=claimants[i % len(claimants)],
+            claim_number=f"CLM-{start + i:08d}",
+            description="Seeded claim",
+            claim_amount=Decimal('100.00'),
+        )
+        for i in range(count)
+    ])
+
+
+class AllClaimsQueryCountTests(TestCase):
+    def setUp(self):
+        self.insurer = User.objects.create_user('insurer')
+        self.insurer.groups.add(Group.objects.create(name='Insurer'))
+        self.policy = create_policy(self.insurer)
+        self.claimants = [
+            User.objects.create_user(f'claimant{i}') for i in range(20)
+        ]
+        for i, claimant in enumerate(self.claimants):
+            UserPolicies.objects.create(
+                user=claimant,
+                policy=self.policy,
+                plan_type='Premium' if i % 2 else 'Regular',
+                duration=12,
+                momo_number='0240000000',
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.insurer)
+
+    def fetch_all_claims(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/all-claims/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        seed_claims(self.claimants, self.policy, 10)
+        _, small_count = self.fetch_all_claims()
+
+        seed_claims(self.claimants[:5], self.policy, 3000)
+        ClaimDocument.objects.bulk_create([
+            ClaimDocument(claim=claim, file='claim_documents/receipt.jpg')
+            for claim in Claim.objects.all()[:500]
+        ])
+        response, large_count = self.fetch_all_claims()
+
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertEqual(small_count, large_count)
+        self.assertLessEqual(large_count, 5)
+
+    def test_plan_type_resolved_per_claimant(self):
+        seed_claims(self.claimants[:2], self.policy, 2)
+        response, _ = self.fetch_all_claims()
+
+        plan_types = sorted(row['policy_type'] for row in response.data['results'])
+        self.assertEqual(plan_types, ['Premium', 'Regular'])
+
+
+class ClaimPaginationTests(TestCase):
+    def setUp(self):
+        self.insurer = User.objects.create_user('insurer')
+        self.insurer.groups.add(Group.objects.create(name='Insurer'))
+        self.policy = create_policy(self.insurer)
+        self.other_policy = create_policy(self.insurer, 'Health', 'Stay Well')
+        self.claimant = User.objects.create_user('claimant')
+        self.client = APIClient()
+
+    def collect_pages(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            pages += 1
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_claim_once_with_tied_dates(self):
+        seed_claims([self.claimant], self.policy, 45)
+        # Force timestamp ties so the id tiebreaker is exercised
+        tied = timezone.now() - timedelta(days=1)
+        Claim.objects.filter(id__in=Claim.objects.order_by('id').values('id')[:20]).update(claim_date=tied)
+
+        self.client.force_authenticate(self.claimant)
+        ids, pages = self.collect_pages('/api/claims/', {'page_size': 10})
+
+        expected = list(Claim.objects.order_by('-claim_date', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 5)
+
+    def test_filters(self):
+        seed_claims([self.claimant], self.policy, 3)
+        seed_claims([self.insurer], self.other_policy, 2)
+        Claim.objects.filter(policy=self.other_policy).update(status='Approved')
+
+        self.client.force_authenticate(self.insurer)
+        response = self.client.get('/api/all-claims/', {'status': 'Approved'})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get('/api/all-claims/', {'claimant': self.claimant.id, 'policy': self.policy.id})
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.client.get('/api/all-claims/', {'date_to': '2000-01-01'})
+        self.assertEqual(response.data['results'], [])
+
+        response = self.client.get('/api/all-claims/', {'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/all-claims/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class DashboardSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member')
+        self.policy = create_policy(self.user)
+        self.subscription = UserPolicies.objects.create(
+            user=self.user, policy=self.policy, plan_type='Regular', duration=6, momo_number='0240000000'
+        )
+        Transaction.objects.create(
+            user=self.user, policy_subscription=self.subscription, transaction_type='Policy Payment',
+            amount=Decimal('50.00'), momo_number='0240000000'
+        )
+        seed_claims([self.user], self.policy, 3)
+        Claim.objects.filter(id=Claim.objects.first().id).update(status='Approved')
+        rebuild_ledger(self.user.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_summary_is_aggregated_and_cached(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/dashboard/summary/')
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(response.data, {
+            'active_policies': 1,
+            'total_claims': 3,
+            'pending_claims': 2,
+            'approved_claims': 1,
+            'total_paid': Decimal('50.00'),
+            'total_received': Decimal('0.00'),
+        })
+
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get('/api/dashboard/summary/')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(cached.data, response.data)
+
+    def test_writes_invalidate_the_cached_summary(self):
+        self.client.get('/api/dashboard/summary/')
+        Claim.objects.create(policy=self.policy, title='New', claimant=self.user, description='')
+
+        response = self.client.get('/api/dashboard/summary/')
+        self.assertEqual(response.data['total_claims'], 4)
+
+
+class RecentTransactionsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('member')
+        self.policy = create_policy(self.user)
+        self.subscription = UserPolicies.objects.create(
+            user=self.user, policy=self.policy, plan_type='Regular', duration=6, momo_number='0241111111'
+        )
+        seed_claims([self.user], self.policy, 2)
+        self.paid_claim, self.legacy_claim = Claim.objects.order_by('id')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_transaction(self, transaction_type, amount, claim=None):
+        return Transaction.objects.create(
+            user=self.user, policy_subscription=self.subscription, transaction_type=transaction_type,
+            claim=claim, amount=Decimal(amount), momo_number='0241111111'
+        )
+
+    def test_merges_transactions_with_legacy_payments(self):
+        for _ in range(3):
+            self.create_transaction('Policy Payment', '50.00')
+        self.create_transaction('Claim Payout', '300.00', claim=self.paid_claim)
+        Payment.objects.create(claim=self.paid_claim, amount=Decimal('300.00'), is_paid=True)
+        legacy = Payment.objects.create(claim=self.legacy_claim, amount=Decimal('120.00'), is_paid=True)
+        # Push the legacy payment to the oldest position in the feed
+        Payment.objects.filter(id=legacy.id).update(payment_date=timezone.now().date() - timedelta(days=2))
+        rebuild_ledger(self.user.id)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/recent-transactions/')
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+
+        rows = response.data['transactions']
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[-1]['id'], f"payment_{legacy.id}")
+        self.assertEqual(rows[-1]['momo_number'], '0241111111')
+        self.assertEqual(rows[-1]['claim_number'], self.legacy_claim.claim_number)
+        self.assertEqual(rows[0]['claim_number'], self.paid_claim.claim_number)
+        self.assertNotIn('claim_number', rows[1])
+        self.assertEqual(response.data['summary'], {
+            'policy_payment_count': 3,
+            'claim_payout_count': 2,
+            'total_paid': Decimal('150.00'),
+            'total_received': Decimal('420.00'),
+        })
+
+    def test_cursor_walks_the_whole_feed(self):
+        for _ in range(5):
+            self.create_transaction('Policy Payment', '50.00')
+        # Legacy payouts share a payment date, so page breaks land on ties
+        seed_claims([self.user], self.policy, 1)
+        for claim in Claim.objects.all():
+            Payment.objects.create(claim=claim, amount=Decimal('120.00'), is_paid=True)
+
+        ids = []
+        response = self.client.get('/api/recent-transactions/', {'page_size': 1})
+        while True:
+            ids.extend(row['id'] for row in response.data['transactions'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(len(ids), 8)
+        self.assertEqual(len(set(ids)), 8)
+
+
+class UserLedgerTests(TestCase):
+    def setUp(self):
+        self.insurer = User.objects.create_user('insurer')
+        self.insurer.groups.add(Group.objects.create(name='Insurer'))
+        self.member = User.objects.create_user('member')
+        self.policy = create_policy(self.insurer)
+        self.client = APIClient()
+
+    def test_views_keep_the_ledger_in_step(self):
+        self.client.force_authenticate(self.member)
+        response = self.client.post('/api/join-policy/', {
+            'policy_id': self.policy.id, 'plan_type': 'Premium', 'duration': 12, 'momo_number': '0240000000'
+        })
+        self.assertEqual(response.status_code, 201)
+        seed_claims([self.member], self.policy, 1)
+
+        self.client.force_authenticate(self.insurer)
+        response = self.client.post(f'/api/process-claim/{Claim.objects.get().id}/', {
+            'status': 'Approved', 'payout_amount': '250.50'
+        })
+        self.assertEqual(response.status_code, 200)
+
+        ledger = UserLedger.objects.get(user=self.member)
+        self.assertEqual(ledger.total_paid, Decimal('100.00'))
+        self.assertEqual(ledger.total_received, Decimal('250.50'))
+        self.assertEqual((ledger.policy_payment_count, ledger.claim_payout_count), (1, 1))
+        call_command('rebuild_ledgers', '--verify', stdout=StringIO())
+
+    def test_rebuild_command_repairs_drift(self):
+        subscription = UserPolicies.objects.create(
+            user=self.member, policy=self.policy, plan_type='Regular', duration=6, momo_number='0240000000'
+        )
+        Transaction.objects.create(
+            user=self.member, policy_subscription=subscription, transaction_type='Policy Payment',
+            amount=Decimal('50.00'), momo_number='0240000000'
+        )
+        ledger = UserLedger.objects.create(user=self.member)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ledgers', '--verify', stdout=StringIO())
+        call_command('rebuild_ledgers', stdout=StringIO())
+        # Rewritten in place rather than deleted and recreated
+        self.assertEqual(UserLedger.objects.get(user=self.member).id, ledger.id)
+        self.assertEqual(UserLedger.objects.get(user=self.member).total_paid, Decimal('50.00'))
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin')
+        self.policy = create_policy(self.admin)
+        create_policy(self.admin, 'Health', 'Stay Well')
+        self.client = APIClient()
+
+    def test_catalog_is_served_from_cache_with_validators(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/policies/')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(response.json()[0]['company']['name'], 'Drive Safe Co')
+
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get('/api/policies/')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(cached.content, response.content)
+
+        not_modified = self.client.get('/api/policies/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        with mock.patch('base.cache.time.time', return_value=time.time() + 1):
+            response = self.client.get('/api/policies/')
+            not_modified = self.client.get('/api/categories/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_writes_invalidate_the_catalog(self):
+        etag = self.client.get(f'/api/policies/{self.policy.id}/')['ETag']
+
+        self.policy.name = 'Drive Safer'
+        self.policy.save()
+
+        response = self.client.get(f'/api/policies/{self.policy.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Drive Safer')
+        self.assertEqual(self.client.get('/api/policies/999999/').status_code, 404)
+
+    def test_last_modified_waits_for_its_second_to_pass(self):
+        now = time.time()
+        with mock.patch('base.cache.time.time', return_value=now + 1):
+            last_modified = self.client.get('/api/policies/')['Last-Modified']
+
+        with mock.patch('base.cache.time.time', return_value=now + 2):
+            self.policy.name = 'Drive Safer'
+            self.policy.save()
+            response = self.client.get('/api/policies/', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            # A second write in this same second would keep the same date
+            self.assertFalse(response.has_header('Last-Modified'))
+
+        with mock.patch('base.cache.time.time', return_value=now + 3):
+            response = self.client.get('/api/policies/')
+        self.assertEqual(response['Last-Modified'], http_date(int(now + 2)))
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-style chat completions endpoint with artificial latency."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests += 1
+        if body.get('stream'):
+            return self.stream_reply(body)
+        time.sleep(self.server.latency)
+        content = json.dumps({
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body['model'],
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': f"Echo: {body['messages'][-1]['content']}"},
+            }],
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (timeout tests)
+            pass
+
+    def stream_reply(self, body):
+        # Spread the latency over the tokens, like a real generation
+        tokens = ['{"label": ', '"Auto", ', '"answer": ', '"Here are ', 'car policies"}']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for token in tokens + [None]:
+            time.sleep(self.server.latency / len(tokens))
+            chunk = {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body['model'],
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': token} if token else {},
+                    'finish_reason': None if token else 'stop',
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AsyncChatbotTests(TestCase):
+    latency = 0.3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeLLMHandler)
+        cls.server.latency = cls.latency
+        cls.server.requests = 0
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        env = {
+            'GROQ_API_KEY': 'test-key',
+            'GROQ_BASE_URL': f'http://127.0.0.1:{self.server.server_port}',
+        }
+        for patcher in (
+            mock.patch.dict(os.environ, env),
+            mock.patch.object(llm, '_async_clients', weakref.WeakKeyDictionary()),
+            mock.patch.object(llm, '_llm_semaphores', weakref.WeakKeyDictionary()),
+            mock.patch.object(ai_logic, 'response_cache', ResponseCache()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def chat(self, message, session_id):
+        return await self.async_client.post(
+            '/api/chatbot-interaction/',
+            {'user_input': message, 'session_id': session_id},
+            content_type='application/json',
+        )
+
+    async def test_concurrent_chats_overlap(self):
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(self.chat(f'hello {i}', f'session-{i}') for i in range(8)))
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual([r.status_code for r in responses], [200] * 8)
+        self.assertEqual(responses[3].json()['chatbot_response'], 'Echo: hello 3')
+        # Serialized calls would take 8 x latency
+        self.assertLess(elapsed, self.latency * 4)
+
+    async def test_saturated_llm_returns_busy(self):
+        with mock.patch.object(llm, 'LLM_MAX_CONCURRENCY', 1), \
+                mock.patch.object(llm, 'LLM_QUEUE_TIMEOUT', 0.05):
+            responses = await asyncio.gather(self.chat('first', 'a'), self.chat('second', 'b'))
+
+        self.assertEqual(sorted(r.status_code for r in responses), [200, 503])
+
+    async def test_slow_llm_times_out_gracefully(self):
+        with mock.patch.object(llm, 'LLM_TIMEOUT', 0.05):
+            response = await self.chat('hello', 'slow')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['chatbot_response'], ai_logic.ERROR_RESPONSE['chatbot_response'])
+
+    @mock.patch.object(ai_logic, 'log_interaction')
+    async def test_first_chat_trains_off_the_event_loop(self, log_interaction):
+        load = intent.load_training_data
+
+        def slow_load(*args):
+            time.sleep(0.3)
+            return load(*args)
+
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        with mock.patch.object(intent, '_classifier', None), \
+                mock.patch.object(intent, 'load_training_data', slow_load):
+            ticker = asyncio.create_task(tick())
+            response = await self.chat('i want car insurance', 'training')
+            ticker.cancel()
+
+        self.assertEqual(response.json()['chatbot_response']['label'], 'Auto')
+        # A blocked loop would not tick at all while training sleeps
+        self.assertGreater(ticks, 10)
+
+    async def test_stream_flag_must_be_true(self):
+        for flag in ('false', '0'):
+            response = await self.async_client.post(
+                '/api/chatbot-interaction/', {'user_input': 'hello', 'session_id': f'form-{flag}', 'stream': flag}
+            )
+            self.assertEqual(response['Content-Type'], 'application/json')
+        response = await self.async_client.post(
+            '/api/chatbot-interaction/', {'user_input': 'hello', 'session_id': 'form-1', 'stream': '1'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+    @mock.patch.object(ai_logic, 'log_interaction')
+    async def test_streams_tokens_before_the_reply_is_complete(self, log_interaction):
+        started = time.perf_counter()
+        response = await self.async_client.post(
+            '/api/chatbot-interaction/',
+            {'user_input': 'which car insurance do you recommend?', 'session_id': 'stream', 'stream': True},
+            content_type='application/json',
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = []
+        async for chunk in response.streaming_content:
+            events.append((time.perf_counter() - started, chunk.decode()))
+
+        first_token_at, first = events[0]
+        self.assertTrue(first.startswith('event: token'))
+        self.assertLess(first_token_at, self.latency * 0.6)
+
+        done = events[-1][1]
+        self.assertTrue(done.startswith('event: done'))
+        payload = json.loads(done.split('data: ', 1)[1])
+        # Label detection ran on the assembled message
+        self.assertEqual(payload['chatbot_response']['label'], 'Auto')
+        self.assertIn('policies_response', payload)
+        log_interaction.assert_called_once()
+        self.assertEqual(len(events), 6)
+
+    async def test_history_is_kept_per_session(self):
+        await self.chat('first question', 'kept')
+        response = await self.chat('second question', 'kept')
+        self.assertEqual(response.json()['chatbot_response'], 'Echo: second question')
+
+        history = await sync_to_async(get_session_store().load)('kept')
+        self.assertEqual([m['role'] for m in history], ['system', 'user', 'assistant', 'user', 'assistant'])
+
+        anonymous = await self.async_client.post(
+            '/api/chatbot-interaction/', {'user_input': 'hi'}, content_type='application/json'
+        )
+        self.assertNotIn(anonymous.json()['session_id'], ('', 'default'))
+
+    @mock.patch.object(ai_logic, 'log_interaction')
+    async def test_category_lookups_skip_the_llm(self, log_interaction):
+        admin = await sync_to_async(User.objects.create_user)('admin')
+        await sync_to_async(create_policy)(admin)
+        requests_before = self.server.requests
+
+        started = time.perf_counter()
+        response = await self.chat('i want a car insurance', 'fast')
+        elapsed = time.perf_counter() - started
+
+        body = response.json()
+        self.assertEqual(body['chatbot_response']['label'], 'Auto')
+        self.assertIn('answer', body['chatbot_response'])
+        self.assertIn('policies_response', body)
+        self.assertEqual(self.server.requests, requests_before)
+        self.assertLess(elapsed, self.latency)
+        log_interaction.assert_called_once()
+
+    async def test_repeated_opening_questions_are_served_from_cache(self):
+        first = await self.chat('Tell me about deductibles', 'first-user')
+        requests_before = self.server.requests
+
+        started = time.perf_counter()
+        second = await self.chat('  tell me about DEDUCTIBLES! ', 'second-user')
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(second.json()['chatbot_response'], first.json()['chatbot_response'])
+        self.assertEqual(self.server.requests, requests_before)
+        self.assertLess(elapsed, self.latency)
+        self.assertEqual(ai_logic.response_cache.stats()['hits'], 1)
+
+        # Later turns always go to the LLM
+        await self.chat('Tell me about deductibles', 'first-user')
+        self.assertEqual(self.server.requests, requests_before + 1)
+
+    async def test_rejects_empty_input(self):
+        response = await self.chat('   ', 'empty')
+        self.assertEqual(response.status_code, 400)
+
+
+class SessionStoreTests(TestCase):
+    def history(self, text):
+        return [{'role': 'user', 'content': text}]
+
+    def test_incomplete_backends_fail_at_construction(self):
+        class HalfStore(SessionStore):
+            def load(self, session_id):
+                return []
+
+        with self.assertRaises(TypeError):
+            HalfStore(ttl=60, max_sessions=1, max_bytes=1)
+
+    def test_memory_store_evicts_least_recently_used(self):
+        store = MemorySessionStore(ttl=3600, max_sessions=2, max_bytes=10 ** 6)
+        store.save('a', self.history('one'))
+        store.save('b', self.history('two'))
+        store.load('a')
+        store.save('c', self.history('three'))
+
+        self.assertEqual(store.load('b'), [])
+        self.assertEqual(store.load('a'), self.history('one'))
+        self.assertEqual(store.stats()['sessions'], 2)
+        self.assertEqual(store.stats()['evictions'], 1)
+
+    def test_memory_store_enforces_byte_cap_and_ttl(self):
+        store = MemorySessionStore(ttl=3600, max_sessions=100, max_bytes=120)
+        store.save('a', self.history('x' * 40))
+        store.save('b', self.history('y' * 40))
+        self.assertEqual(store.stats()['sessions'], 1)
+        self.assertLessEqual(store.stats()['bytes'], 120)
+
+        store.ttl = 0
+        time.sleep(0.01)
+        self.assertEqual(store.load('b'), [])
+        self.assertEqual(store.stats(), {'sessions': 0, 'bytes': 0, 'evictions': 2})
+
+    def test_database_store_purges_expired_and_over_cap(self):
+        store = DatabaseSessionStore(ttl=3600, max_sessions=2, max_bytes=10 ** 6)
+        for session_id in ('a', 'b', 'c', 'old'):
+            store.save(session_id, self.history(session_id))
+        ChatSession.objects.filter(session_id='old').update(updated_at=timezone.now() - timedelta(days=2))
+        ChatSession.objects.filter(session_id='a').update(updated_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(store.load('old'), [])
+        self.assertEqual(store.purge(), 2)
+        self.assertEqual(sorted(ChatSession.objects.values_list('session_id', flat=True)), ['b', 'c'])
+        self.assertEqual(store.stats()['sessions'], 2)
+        self.assertGreater(store.stats()['bytes'], 0)
+
+
+class HistoryCompactionTests(TestCase):
+    def test_prompt_stays_within_budget_in_long_sessions(self):
+        summaries = set()
+        for turn in range(60):
+            history = ai_logic.start_turn(f"question {turn} " + "about my policy " * 150, 'long')
+            self.assertLessEqual(history_tokens(history), HISTORY_TOKENS)
+            self.assertTrue(history[-1]['content'].startswith(f"question {turn} "))
+            if is_summary(history[1]):
+                summaries.add(history[1]['content'])
+            ai_logic.save_reply('long', history, json.dumps({"label": "Auto", "answer": "x" * 3000}))
+
+        stored = get_session_store().load('long')
+        self.assertEqual(stored[0]['role'], 'system')
+        self.assertIn('Assistant suggested Auto policies', stored[1]['content'])
+        # The summary is rewritten every few turns, not on every one
+        self.assertGreater(len(summaries), 1)
+        self.assertLess(len(summaries), 30)
+
+    def test_short_sessions_are_kept_verbatim(self):
+        history = ai_logic.start_turn('hi', 'short')
+        ai_logic.save_reply('short', history, 'hello')
+        history = ai_logic.start_turn('thanks', 'short')
+        self.assertEqual([message['content'] for message in history[1:]], ['hi', 'hello', 'thanks'])
+
+
+class InteractionLogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'interactions.jsonl')
+
+    def test_background_writer_appends_batches(self):
+        log = InteractionLog(self.path)
+        with mock.patch.object(ai_logic, 'interaction_log', log):
+            for index in range(5):
+                ai_logic.log_interaction(f'question {index}', 'Auto', 'answer')
+
+            deadline = time.monotonic() + 5
+            while len(list(read_interactions(log))) < 5 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            entries = list(ai_logic.read_logged_interactions())
+
+        self.assertEqual([entry['user_input'] for entry in entries], [f'question {i}' for i in range(5)])
+        self.assertEqual(entries[0]['category'], 'Auto')
+
+    def test_close_waits_for_the_batch_being_written(self):
+        log = InteractionLog(self.path)
+        write = log.write
+
+        def slow_write(batch):
+            time.sleep(0.2)
+            write(batch)
+
+        with mock.patch.object(log, 'write', slow_write):
+            log.append({'index': 0})
+            # Let the writer take the first entry off the queue
+            while not log.queue.empty():
+                time.sleep(0.01)
+            for index in range(1, 5):
+                log.append({'index': index})
+            log.close()
+
+        self.assertFalse(log.thread.is_alive())
+        self.assertEqual([entry['index'] for entry in read_interactions(log)], list(range(5)))
+
+    def test_concurrent_writers_rotate_without_losing_lines(self):
+        # Separate instances stand in for separate worker processes
+        logs = [InteractionLog(self.path, max_bytes=2000, backups=100) for _ in range(4)]
+
+        def write(log, writer):
+            for index in range(50):
+                log.write([{'writer': writer, 'index': index}])
+
+        threads = [threading.Thread(target=write, args=(log, writer)) for writer, log in enumerate(logs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        entries = list(read_interactions(logs[0]))
+        self.assertEqual(len(entries), 200)
+        self.assertGreater(len(logs[0].files()), 1)
+        for writer in range(4):
+            self.assertEqual([e['index'] for e in entries if e['writer'] == writer], list(range(50)))
+
+
+class CategoryResolverTests(TestCase):
+    def test_exact_alias_and_fuzzy_matches(self):
+        resolver = CategoryResolver([(1, 'Auto'), (2, 'Health'), (3, 'Travel'), (4, 'Home')])
+        self.assertEqual(resolver.resolve('auto'), 1)
+        self.assertEqual(resolver.resolve('Health Insurance'), 2)
+        self.assertEqual(resolver.resolve('car'), 1)
+        self.assertEqual(resolver.resolve('Helth'), 2)
+        self.assertEqual(resolver.resolve('travle'), 3)
+        self.assertIsNone(resolver.resolve('Pets'))
+        self.assertIsNone(resolver.resolve(''))
+
+    def test_fuzzy_matches_prefer_the_closest_name(self):
+        resolver = CategoryResolver([(1, 'Pet'), (2, 'Pets and Livestock')])
+        # "pets and livestock" shares more trigrams with "pets", but "pet" is closer
+        self.assertEqual(resolver.resolve('pets'), 1)
+        self.assertIsNone(resolver.resolve('carpet'))
+
+    def test_resolver_follows_category_changes(self):
+        cache.clear()
+        auto = Category.objects.create(name='Auto')
+        self.assertEqual(resolve_category('Auto'), auto.id)
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_category('Travel'))
+
+        travel = Category.objects.create(name='Travel')
+        self.assertEqual(resolve_category('Travel'), travel.id)
+
+
+class PolicySnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_user('admin')
+        self.cheap = create_policy(admin, 'Auto', 'Cheap Ride')
+        self.rated = create_policy(admin, 'Auto', 'Top Rated')
+        Company.objects.filter(pk=self.rated.company_id).update(rating=Decimal('4.8'))
+        create_policy(admin, 'Health', 'Clinic Care')
+        self.category_id = self.cheap.company.company_category_id
+
+    def test_snapshot_is_ranked_cached_and_query_free(self):
+        with self.assertNumQueries(1):
+            policies = ai_logic.get_policies(self.category_id)['policies']
+        self.assertEqual([policy['name'] for policy in policies], ['Top Rated', 'Cheap Ride'])
+        self.assertEqual(policies[0]['company'], 'Top Rated Co')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(len(ai_logic.get_policies(self.category_id, limit=1)['policies']), 1)
+
+    def test_catalog_writes_refresh_the_snapshot(self):
+        ai_logic.get_policies(self.category_id)
+        self.cheap.is_active = False
+        self.cheap.save()
+        policies = ai_logic.get_policies(self.category_id)['policies']
+        self.assertEqual([policy['name'] for policy in policies], ['Top Rated'])
+        self.assertEqual(ai_logic.get_policies(None), {"message": "We don't offer these type of policies yet"})
+
+
+class IntentClassifierTests(TestCase):
+    def setUp(self):
+        self.classifier = IntentClassifier(*load_training_data(ai_logic.valid_categories, [
+            {'user_input': 'cover my shipping containers', 'category': 'Business'},
+        ]))
+
+    def test_confident_category_lookups(self):
+        self.assertEqual(self.classifier.classify('i want a car insurance'), 'Auto')
+        self.assertEqual(self.classifier.classify('Insure my HOUSE against fire!'), 'Home')
+        self.assertEqual(self.classifier.classify('I need insurance for my trip abroad'), 'Travel')
+        # Learned from the interaction log
+        self.assertEqual(self.classifier.classify('shipping container insurance'), 'Business')
+
+    def test_open_ended_or_ambiguous_messages_go_to_the_llm(self):
+        self.assertIsNone(self.classifier.classify('what does car insurance cover?'))
+        self.assertIsNone(self.classifier.classify('how do claims work'))
+        self.assertIsNone(self.classifier.classify('my car and my house'))
+        self.assertIsNone(self.classifier.classify('hello there'))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_normalized_and_fuzzy_keys(self):
+        self.assertEqual(normalize("  What's  COVERED, exactly?! "), 'what s covered exactly')
+
+        exact = ResponseCache(fuzzy=False)
+        exact.set('Do you cover floods?', 'answer')
+        self.assertEqual(exact.get('do you cover FLOODS'), 'answer')
+        self.assertIsNone(exact.get('floods do you cover'))
+
+        fuzzy = ResponseCache(fuzzy=True)
+        fuzzy.set('Do you cover floods?', 'answer')
+        self.assertEqual(fuzzy.get('hello, floods do you cover'), 'answer')
+        self.assertEqual(fuzzy.stats()['hits'], 1)
+
+    def test_catalog_changes_ttl_and_size_bound(self):
+        response_cache = ResponseCache(max_entries=2, ttl=3600)
+        response_cache.set('one', 1)
+        response_cache.set('two', 2)
+        response_cache.set('three', 3)
+        self.assertIsNone(response_cache.get('one'))
+        self.assertEqual(response_cache.get('three'), 3)
+
+        create_policy(User.objects.create_user('admin'))
+        self.assertIsNone(response_cache.get('three'))
+
+        response_cache.set('four', 4)
+        response_cache.ttl = 0
+        time.sleep(0.01)
+        self.assertIsNone(response_cache.get('four'))
+        self.assertEqual(response_cache.stats()['misses'], 3)
+
+
+class ClaimUploadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.temp_dir = os.path.join(directory.name, 'parts')
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(directory.name, 'media'),
+            CLAIM_UPLOADS={
+                'CHUNK_SIZE': 4,
+                'MAX_FILE_BYTES': 64,
+                'MAX_CLAIM_BYTES': 100,
+                'TEMP_DIR': self.temp_dir,
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.claimant = User.objects.create_user('claimant')
+        policy = create_policy(User.objects.create_user('admin'))
+        seed_claims([self.claimant], policy, 1)
+        self.claim = Claim.objects.get()
+        self.client = APIClient()
+        self.client.force_authenticate(self.claimant)
+        self.content = b'photo-of-the-damaged-bumper'
+
+    def start(self, **data):
+        data = {'filename': '../bumper.jpg', 'size': len(self.content), **data}
+        return self.client.post(f'/api/claims/{self.claim.id}/uploads/', data, format='json')
+
+    def put(self, upload_id, start, end):
+        return self.client.generic(
+            'PUT', f'/api/uploads/{upload_id}/', self.content[start:end + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.content)}'
+        )
+
+    def test_resumable_upload_becomes_a_claim_document(self):
+        upload_id = self.start(sha256=hashlib.sha256(self.content).hexdigest()).json()['upload_id']
+
+        self.assertEqual(self.put(upload_id, 0, 9).json()['received'], 10)
+        # A gap is refused, a resent or overlapping chunk is fine
+        gap = self.put(upload_id, 15, 20)
+        self.assertEqual((gap.status_code, gap.json()['received']), (416, 10))
+        self.assertEqual(self.put(upload_id, 0, 9).json()['received'], 10)
+        self.assertEqual(self.put(upload_id, 5, 19).json()['received'], 20)
+
+        early = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(early.status_code, 409)
+
+        self.put(upload_id, 20, len(self.content) - 1)
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['filename'], 'bumper.jpg')
+
+        document = ClaimDocument.objects.get(claim=self.claim)
+        self.assertEqual(document.size, len(self.content))
+        with document.file.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_checksum_mismatch_resets_the_upload(self):
+        upload_id = self.start(sha256='0' * 64).json()['upload_id']
+        self.put(upload_id, 0, len(self.content) - 1)
+
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual((response.status_code, response.json()['received']), (400, 0))
+        self.assertFalse(ClaimDocument.objects.exists())
+
+    def test_bad_headers_and_processed_claims_are_refused(self):
+        upload_id = self.start().json()['upload_id']
+        response = self.client.generic(
+            'PUT', f'/api/uploads/{upload_id}/', self.content, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{len(self.content) - 1}/{len(self.content)}', CONTENT_LENGTH='many'
+        )
+        self.assertEqual((response.status_code, response.json()['received']), (400, 0))
+
+        self.put(upload_id, 0, len(self.content) - 1)
+        Claim.objects.filter(pk=self.claim.pk).update(status='Approved')
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ClaimDocument.objects.exists())
+
+    def test_per_claim_and_per_file_limits(self):
+        self.assertEqual(self.start(size=65).status_code, 413)
+        self.assertEqual(self.start(size=60).status_code, 201)
+        self.assertEqual(self.start(size=41).status_code, 413)
+
+        upload = ClaimUpload.objects.get()
+        self.assertEqual(self.client.delete(f'/api/uploads/{upload.id}/').status_code, 204)
+        self.assertEqual(self.start(size=41).status_code, 201)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('someone-else'))
+        self.assertEqual(other.get(f'/api/uploads/{ClaimUpload.objects.get().id}/').status_code, 404)
+
+
+class DocumentStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = directory.name
+
+        policy = create_policy(User.objects.create_user('admin'))
+        seed_claims([User.objects.create_user('claimant')], policy, 2)
+        self.claims = list(Claim.objects.all())
+
+    def attach(self, claim, name, content):
+        return ClaimDocument.objects.create(claim=claim, file=SimpleUploadedFile(name, content), size=len(content))
+
+    def test_identical_documents_share_one_blob(self):
+        first = self.attach(self.claims[0], 'receipt.jpg', b'same receipt')
+        second = self.attach(self.claims[1], 'receipt-copy.jpg', b'same receipt')
+        digest = hashlib.sha256(b'same receipt').hexdigest()
+
+        self.assertEqual(first.file.name, blob_name(digest))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual((first.filename, second.filename), ('receipt.jpg', 'receipt-copy.jpg'))
+        self.assertEqual(DocumentBlob.objects.get(sha256=digest).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(second.file.storage.exists(second.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(DocumentBlob.objects.exists())
+        self.assertFalse(second.file.storage.exists(second.file.name))
+
+    def test_blob_collected_mid_upload_is_written_back(self):
+        first = self.attach(self.claims[0], 'receipt.jpg', b'same receipt')
+        digest = first.sha256
+        with self.captureOnCommitCallbacks(execute=False):
+            first.delete()
+
+        # The pending collection lands after the storage found the blob but before it is retained
+        real_retain = signals.retain_blob
+
+        def collect_then_retain(*args):
+            delete_unreferenced_blob(digest)
+            real_retain(*args)
+
+        with mock.patch.object(signals, 'retain_blob', collect_then_retain):
+            second = self.attach(self.claims[1], 'receipt.jpg', b'same receipt')
+        self.assertTrue(second.file.storage.exists(second.file.name))
+        self.assertEqual(DocumentBlob.objects.get(sha256=digest).ref_count, 1)
+
+    def test_replacing_a_file_moves_the_reference(self):
+        document = self.attach(self.claims[0], 'receipt.jpg', b'old receipt')
+        old_digest = document.sha256
+        document.file = SimpleUploadedFile('receipt.jpg', b'new receipt')
+        with mock.patch.object(derivatives, 'get_executor') as get_executor, self.captureOnCommitCallbacks(execute=True):
+            document.save()
+        # New content gets fresh derivatives
+        get_executor.return_value.submit.assert_called_once_with(derivatives.render_in_pool, document.id)
+
+        self.assertEqual(document.sha256, hashlib.sha256(b'new receipt').hexdigest())
+        self.assertEqual(list(DocumentBlob.objects.values_list('sha256', 'ref_count')), [(document.sha256, 1)])
+        self.assertFalse(document.file.storage.exists(blob_name(old_digest)))
+
+    def test_legacy_files_move_into_blobs_and_verify(self):
+        os.makedirs(os.path.join(self.media_root, 'claim_documents'))
+        for name in ('timeline.jpg', 'timeline_k6RjMiz.jpg'):
+            with open(os.path.join(self.media_root, 'claim_documents', name), 'wb') as file:
+                file.write(b'timeline photo')
+        for claim, name in zip(self.claims, ('timeline.jpg', 'timeline_k6RjMiz.jpg')):
+            ClaimDocument.objects.bulk_create([ClaimDocument(claim=claim, file=f'claim_documents/{name}')])
+
+        call_command('dedupe_claim_documents', stdout=StringIO())
+
+        self.assertEqual(ClaimDocument.objects.values('file').distinct().count(), 1)
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 2)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'claim_documents')), ['blobs'])
+        call_command('dedupe_claim_documents', verify=True, stdout=StringIO())
+
+        with open(os.path.join(self.media_root, ClaimDocument.objects.first().file.name), 'wb') as file:
+            file.write(b'tampered')
+        with self.assertRaises(CommandError):
+            call_command('dedupe_claim_documents', verify=True, stdout=StringIO(), stderr=StringIO())
+
+
+class DocumentDerivativeTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.claimant = User.objects.create_user('claimant')
+        policy = create_policy(User.objects.create_user('admin'))
+        seed_claims([self.claimant], policy, 1)
+        self.claim = Claim.objects.get()
+        self.client = APIClient()
+        self.client.force_authenticate(self.claimant)
+
+    def attach(self, name, content):
+        return ClaimDocument.objects.create(claim=self.claim, file=SimpleUploadedFile(name, content), size=len(content))
+
+    def photo(self):
+        output = io.BytesIO()
+        derivatives.Image.new('RGB', (2400, 1800), 'orange').save(output, 'PNG')
+        return output.getvalue()
+
+    def test_derivatives_render_on_first_request(self):
+        document = self.attach('bumper.png', self.photo())
+        data = ClaimDocumentSerializer(document).data
+        self.assertEqual(data['thumbnail_url'], f'/api/documents/{document.id}/thumbnail/')
+        self.assertEqual(data['preview_url'], f'/api/documents/{document.id}/preview/')
+
+        response = self.client.get(data['thumbnail_url'])
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        with derivatives.Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 240))
+        document.refresh_from_db()
+        self.assertEqual(set(document.derivatives), {'thumbnail', 'preview'})
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('someone-else'))
+        self.assertEqual(other.get(f'/api/documents/{document.id}/preview/').status_code, 404)
+
+    def test_uploads_are_queued_and_non_images_skipped(self):
+        with mock.patch.object(derivatives, 'get_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                document = self.attach('bumper.png', self.photo())
+                self.attach('report.pdf', b'%PDF-1.4')
+        get_executor.return_value.submit.assert_called_once_with(derivatives.render_in_pool, document.id)
+
+        pdf = ClaimDocument.objects.get(filename='report.pdf')
+        self.assertIsNone(ClaimDocumentSerializer(pdf).data['thumbnail_url'])
+
+
+    def test_concurrent_renders_share_names_and_go_with_the_blob(self):
+        document = self.attach('bumper.png', self.photo())
+        derivatives.generate_derivatives(document)
+        # A second renderer that checked before the first one wrote
+        with mock.patch.object(derivatives.default_storage, 'exists', return_value=False):
+            derivatives.generate_derivatives(document)
+        root = os.path.join(derivatives.default_storage.location, derivatives.DERIVATIVE_DIR)
+        rendered = sorted(os.path.relpath(os.path.join(path, name), root)
+                          for path, _, names in os.walk(root) for name in names)
+        self.assertEqual(rendered, sorted(os.path.relpath(
+            derivatives.default_storage.path(name), root) for name in document.derivatives.values()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+        self.assertFalse(any(derivatives.default_storage.exists(name) for name in document.derivatives.values()))
+
+    def test_truncated_images_are_unsupported(self):
+        document = self.attach('bumper.png', self.photo()[:200])
+        response = self.client.get(f'/api/documents/{document.id}/thumbnail/')
+        self.assertEqual(response.status_code, 404)
+        document.refresh_from_db()
+        self.assertEqual(document.derivatives, {derivatives.UNSUPPORTED: True})
+        with mock.patch('base.views.generate_derivatives') as generate:
+            response = self.client.get(f'/api/documents/{document.id}/preview/')
+        self.assertEqual(response.status_code, 404)
+        generate.assert_not_called()
+
+        # Some decoders report broken files with other exception types
+        document = self.attach('scan.png', self.photo())
+        with mock.patch.object(derivatives, 'render', side_effect=SyntaxError('broken PNG file')):
+            response = self.client.get(f'/api/documents/{document.id}/preview/')
+        self.assertEqual(response.status_code, 404)
+
+class DocumentDeliveryTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.claimant = User.objects.create_user('claimant')
+        policy = create_policy(User.objects.create_user('admin'))
+        seed_claims([self.claimant], policy, 1)
+        self.content = bytes(range(256)) * 40
+        self.document = ClaimDocument.objects.create(
+            claim=Claim.objects.get(),
+            file=SimpleUploadedFile('evidence.pdf', self.content),
+            size=len(self.content)
+        )
+        self.url = f'/api/documents/{self.document.id}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.claimant)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_debug_media_route_skips_claim_documents(self):
+        from insureMeB import urls
+
+        def load_urls():
+            importlib.reload(urls)
+            clear_url_caches()
+        with override_settings(DEBUG=True):
+            load_urls()
+        self.addCleanup(load_urls)
+
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'documents'))
+        with open(os.path.join(settings.MEDIA_ROOT, 'documents', 'public.txt'), 'wb') as file:
+            file.write(b'public')
+        self.assertEqual(self.client.get('/media/documents/public.txt').status_code, 200)
+        name = self.document.file.name
+        self.assertTrue(name.startswith('claim_documents/'))
+        for url in (f'/media/{name}', f'/media//{name}', f'/media/./{name}', f'/media/documents/../{name}'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_only_passive_types_display_inline(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response['Content-Disposition'].startswith('inline;'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+        for filename in ('page.html', 'drawing.svg', 'notes'):
+            document = ClaimDocument.objects.create(
+                claim=self.document.claim, file=SimpleUploadedFile(filename, b'<script>alert(1)</script>'),
+                filename=filename, size=25
+            )
+            response = self.client.get(f'/api/documents/{document.id}/')
+            self.assertEqual(response['Content-Type'], 'application/octet-stream')
+            self.assertTrue(response['Content-Disposition'].startswith('attachment;'))
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_full_conditional_and_ranged_downloads(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], f'"{self.document.sha256}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        partial = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(self.body(partial), self.content[100:200])
+
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.body(suffix), self.content[-10:])
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual((stale.status_code, len(self.body(stale))), (200, len(self.content)))
+
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+    def test_offloaded_delivery_and_access_control(self):
+        with override_settings(DOCUMENT_DELIVERY={'MODE': 'accel', 'ACCEL_PREFIX': '/protected-media/'}):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(DOCUMENT_DELIVERY={'MODE': 'sendfile'}):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.document.file.path)
+
+        stranger = APIClient()
+        stranger.force_authenticate(User.objects.create_user('stranger'))
+        self.assertEqual(stranger.get(self.url).status_code, 404)
+
+        insurer = User.objects.create_user('insurer')
+        insurer.groups.add(Group.objects.create(name='Insurer'))
+        stranger.force_authenticate(insurer)
+        self.assertEqual(stranger.get(self.url).status_code, 200)
+
+
+class BatchAdjudicationTests(TestCase):
+    def setUp(self):
+        self.insurer = User.objects.create_user('insurer')
+        self.insurer.groups.add(Group.objects.create(name='Insurer'))
+        self.policy = create_policy(self.insurer)
+        self.members = [User.objects.create_user(f'member{i}') for i in range(3)]
+        for member in self.members:
+            UserPolicies.objects.create(
+                user=member, policy=self.policy, plan_type='Regular', duration=12, momo_number='0240000000'
+            )
+            rebuild_ledger(member.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.insurer)
+
+    def decide(self, decisions):
+        return self.client.post('/api/process-claims/', {'decisions': decisions}, format='json')
+
+    def test_mixed_batch_reports_each_decision(self):
+        seed_claims(self.members, self.policy, 4)
+        claims = list(Claim.objects.order_by('id'))
+        Payment.objects.create(claim=claims[3], amount=Decimal('10.00'), is_paid=True)
+        rebuild_ledger(claims[3].claimant_id)
+
+        response = self.decide([
+            {'claim_id': claims[0].id, 'status': 'Approved', 'payout_amount': '120.50'},
+            {'claim_id': claims[1].id, 'status': 'Approved', 'payout_amount': '9000'},
+            {'claim_id': claims[2].id, 'status': 'Denied', 'adjustment_note': 'No receipts'},
+            {'claim_id': claims[0].id, 'status': 'Denied'},
+            {'claim_id': claims[3].id, 'status': 'Approved', 'payout_amount': '80'},
+            {'claim_id': 999999, 'status': 'Approved', 'payout_amount': '1'},
+            {'claim_id': claims[1].id, 'status': 'Pending'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['approved'], data['denied'], data['failed']), (2, 1, 4))
+        self.assertEqual([result['ok'] for result in data['results']], [True, False, True, False, True, False, False])
+        self.assertIn('Regular plan coverage', data['results'][1]['error'])
+
+        claims = list(Claim.objects.order_by('id'))
+        self.assertEqual([claim.status for claim in claims], ['Approved', 'Pending', 'Denied', 'Approved'])
+        self.assertEqual(claims[2].adjustment_note, 'No receipts')
+        # The already paid claim gets no second payment
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertEqual(Transaction.objects.get().amount, Decimal('120.50'))
+        # claims[0] and claims[3] share a claimant, who already had the 10.00 payout
+        self.assertEqual(UserLedger.objects.get(user=claims[0].claimant).total_received, Decimal('130.50'))
+        call_command('rebuild_ledgers', '--verify', stdout=StringIO())
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        seed_claims(self.members, self.policy, 300)
+        decisions = [
+            {'claim_id': claim_id, 'status': 'Approved', 'payout_amount': '10'}
+            for claim_id in Claim.objects.values_list('id', flat=True)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.decide(decisions)
+        self.assertEqual(response.json()['approved'], 300)
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(UserLedger.objects.get(user=self.members[0]).claim_payout_count, 100)
+
+    def test_only_insurers_may_batch(self):
+        self.client.force_authenticate(self.members[0])
+        self.assertEqual(self.decide([{'claim_id': 1, 'status': 'Denied'}]).status_code, 403)
+
+
+class SubscriptionBillingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('member')
+        self.policy = create_policy(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def join(self, plan_type, duration, joined):
+        self.client.post('/api/join-policy/', {
+            'policy_id': self.policy.id, 'plan_type': plan_type, 'duration': duration, 'momo_number': '0240000000'
+        })
+        subscription = UserPolicies.objects.latest('id')
+        UserPolicies.objects.filter(id=subscription.id).update(
+            creation_date=datetime(joined.year, joined.month, joined.day, 9, tzinfo=dt_timezone.utc)
+        )
+        return subscription
+
+    def test_periods_follow_calendar_months(self):
+        joined = datetime(2026, 1, 31, 9, tzinfo=dt_timezone.utc)
+        self.assertEqual(periods_due(joined, 12, 1, date(2026, 2, 27)), [])
+        self.assertEqual(periods_due(joined, 12, 1, date(2026, 2, 28)), [2])
+        self.assertEqual(periods_due(joined, 12, 1, date(2026, 5, 1)), [2, 3, 4])
+        self.assertEqual(periods_due(joined, 3, 1, date(2027, 1, 1)), [2, 3])
+
+    def test_due_months_are_charged_once(self):
+        rebuild_ledger(self.user.id)
+        regular = self.join('Regular', 12, date(2026, 1, 15))
+        premium = self.join('Premium', 2, date(2026, 3, 1))
+        paused = self.join('Regular', 12, date(2026, 1, 15))
+        UserPolicies.objects.filter(id=paused.id).update(status='On Pause')
+
+        self.assertEqual(bill_subscriptions(date(2026, 4, 20), chunk_size=1), (2, 4))
+        self.assertEqual(bill_subscriptions(date(2026, 4, 20)), (1, 0))
+        self.assertEqual(bill_subscriptions(date(2026, 5, 15)), (1, 1))
+
+        periods = lambda subscription: list(Transaction.objects.filter(
+            policy_subscription=subscription).order_by('billing_period').values_list('billing_period', flat=True))
+        self.assertEqual(periods(regular), [1, 2, 3, 4, 5])
+        self.assertEqual(periods(premium), [1, 2])
+        self.assertEqual(periods(paused), [1])
+        self.assertEqual(UserPolicies.objects.get(id=regular.id).periods_billed, 5)
+        ledger = UserLedger.objects.get(user=self.user)
+        self.assertEqual(ledger.total_paid, 5 * self.policy.regular + 2 * self.policy.premium + self.policy.regular)
+        call_command('rebuild_ledgers', '--verify', stdout=StringIO())
+
+    def test_expiry_waits_for_unbilled_months(self):
+        subscription = self.join('Regular', 3, date(2026, 1, 15))
+        UserPolicies.objects.filter(id=subscription.id).update(expiry_date=date(2026, 4, 15))
+
+        self.assertEqual(expire_subscriptions(date(2026, 5, 1)), 0)
+        self.assertEqual(bill_subscriptions(date(2026, 5, 1)), (1, 2))
+        self.assertEqual(expire_subscriptions(date(2026, 5, 1)), 1)
+        self.assertEqual(UserPolicies.objects.get(id=subscription.id).status, 'Complete')
+
+
+class SubscriptionExpiryTests(TestCase):
+    def test_expired_subscriptions_complete_and_drop_dashboards(self):
+        users = [User.objects.create_user(f'member{i}') for i in range(3)]
+        policy = create_policy(users[0])
+        expiries = [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 1), None]
+        for index, expiry_date in enumerate(expiries):
+            UserPolicies.objects.create(
+                user=users[index % 3], policy=policy, plan_type='Regular', duration=1, periods_billed=1,
+                momo_number='0240000000', expiry_date=expiry_date
+            )
+        for user in users:
+            cache.set(dashboard_summary_key(user.id), {'active_policies': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_subscriptions(date(2026, 3, 1), chunk_size=1), 2)
+
+        statuses = list(UserPolicies.objects.order_by('id').values_list('status', flat=True))
+        self.assertEqual(statuses, ['Complete', 'Complete', 'Active', 'Active'])
+        self.assertIsNone(cache.get(dashboard_summary_key(users[0].id)))
+        self.assertIsNone(cache.get(dashboard_summary_key(users[1].id)))
+        self.assertIsNotNone(cache.get(dashboard_summary_key(users[2].id)))
+        self.assertEqual(expire_subscriptions(date(2026, 3, 1)), 0)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('adjuster', password='secret')
+        self.insurers = Group.objects.create(name='Insurer')
+        self.user.groups.add(self.insurers)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def authenticate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CachedTokenAuthentication().authenticate_credentials(self.token.key)[0]
+
+    def test_repeat_requests_skip_token_and_role_queries(self):
+        self.assertEqual(self.authenticate().roles, {'Insurer'})
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual((user.pk, user.username, user.roles), (self.user.pk, 'adjuster', {'Insurer'}))
+        # The password hash stays out of the cache and loads on demand
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('secret'))
+
+        response = self.client.get('/api/all-claims/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_group_changes_and_logout_invalidate(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.insurers)
+        self.assertEqual(self.authenticate().roles, frozenset())
+        self.assertEqual(self.client.get('/api/all-claims/').status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.insurers.user_set.add(self.user)
+        self.assertEqual(self.authenticate().roles, {'Insurer'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/all-claims/').status_code, 401)
+
+    def test_deleted_token_is_forgotten_on_commit(self):
+        self.authenticate()
+        key = token_cache_key(self.token.key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.token.delete()
+            self.assertIsNotNone(cache.get(key))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(key))
@@ -0,0 +1,200 @@
+"""
+Resumable, chunked uploads of claim documents.
+
+A client starts an upload with the file's name, size and optional SHA-256,
+PUTs byte ranges (Content-Range: bytes start-end/total) and then finalizes
+it. Chunks are streamed straight into a part file under TEMP_DIR and must
+start at or before the stored prefix ends, so after a dropped connection the
+client reads `received` and carries on from there. Finalizing checks the
+size and checksum and copies the part file into storage as a ClaimDocument.
+"""
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Claim, ClaimDocument, ClaimUpload
+
+DEFAULTS = {
+    'CHUNK_SIZE': 1024 * 1024,
+    'MAX_FILE_BYTES': 25 * 1024 * 1024,
+    'MAX_CLAIM_BYTES': 100 * 1024 * 1024,
+    # Outside MEDIA_ROOT so part files are never served as media
+    'TEMP_DIR': os.path.join(settings.BASE_DIR, 'claim_uploads'),
+    'TTL': 60 * 60 * 24,
+}
+COPY_BUFFER = 64 * 1024
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_options():
+    return {**DEFAULTS, **getattr(settings, 'CLAIM_UPLOADS', {})}
+
+
+def part_path(upload):
+    return os.path.join(upload_options()['TEMP_DIR'], f"{upload.id}.part")
+
+
+def claim_bytes_in_use(claim):
+    """Bytes taken by a claim's documents plus what its open uploads declared."""
+    documents = ClaimDocument.objects.filter(claim=claim).aggregate(total=Sum('size'))['total'] or 0
+    uploads = ClaimUpload.objects.filter(claim=claim, status='Uploading').aggregate(total=Sum('size'))['total'] or 0
+    return documents + uploads
+
+
+def start_upload(claim, filename, size, sha256=''):
+    options = upload_options()
+    filename = os.path.basename(str(filename or '')).strip()
+    if not filename:
+        raise UploadError('A filename is required')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be a number of bytes')
+    if size <= 0:
+        raise UploadError('size must be positive')
+    if size > options['MAX_FILE_BYTES']:
+        raise UploadError(f"Files are limited to {options['MAX_FILE_BYTES']} bytes", status=413)
+    sha256 = (sha256 or '').lower()
+    if sha256 and not SHA256.match(sha256):
+        raise UploadError('sha256 must be a hex SHA-256 digest')
+
+    with transaction.atomic():
+        # Serialize concurrent starts on the same claim so the limit holds
+        Claim.objects.select_for_update().filter(pk=claim.pk).first()
+        if claim_bytes_in_use(claim) + size > options['MAX_CLAIM_BYTES']:
+            raise UploadError(f"Documents of a claim are limited to {options['MAX_CLAIM_BYTES']} bytes", status=413)
+        upload = ClaimUpload.objects.create(claim=claim, filename=filename[:255], size=size, sha256=sha256)
+
+    os.makedirs(options['TEMP_DIR'], exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def parse_content_range(header):
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        raise UploadError('Content-Range must look like "bytes start-end/total"')
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise UploadError('Content-Range end is before its start')
+    return start, end, total
+
+
+def write_chunk(upload, stream, content_range, content_length):
+    """
+    Store one byte range read from `stream` and return the new `received`.
+
+    Ranges that end inside the stored prefix are accepted without writing,
+    so a client can safely resend a chunk it never got an answer for.
+    """
+    if upload.status != 'Uploading':
+        raise UploadError('Upload is already finalized', status=409)
+    start, end, total = parse_content_range(content_range)
+    if total != upload.size or end >= upload.size:
+        raise UploadError('Content-Range does not match the upload size', status=416)
+    if start > upload.received:
+        raise UploadError(f'Chunk must start at or before byte {upload.received}', status=416)
+    length = end - start + 1
+    if content_length != length:
+        raise UploadError('Content-Length does not match Content-Range')
+    if end < upload.received:
+        return upload.received
+
+    written = 0
+    with open(part_path(upload), 'r+b') as part:
+        part.seek(start)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER, length - written)) if stream else b''
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+
+    # Only ever move forward; a concurrent PUT may have got further already
+    ClaimUpload.objects.filter(pk=upload.pk, received__lt=start + written).update(
+        received=start + written, updated_at=timezone.now()
+    )
+    upload.refresh_from_db(fields=['received'])
+    if written < length:
+        raise UploadError(f'Chunk was cut short, {upload.received} bytes are stored')
+    return upload.received
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(COPY_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_upload(upload):
+    """Verify a fully received upload and turn it into a ClaimDocument."""
+    with transaction.atomic():
+        upload = ClaimUpload.objects.select_for_update().select_related('document').get(pk=upload.pk)
+        if upload.status == 'Complete':
+            return upload.document
+        if upload.received != upload.size:
+            raise UploadError(f'Only {upload.received} of {upload.size} bytes were received', status=409)
+        # The claim may have been processed while the upload was in progress
+        claim = Claim.objects.select_for_update().only('status').get(pk=upload.claim_id)
+        if claim.status not in ['Pending', 'Submitted']:
+            raise UploadError('Cannot upload documents to processed claims', status=409)
+
+        path = part_path(upload)
+        digest = file_sha256(path)
+        verified = not upload.sha256 or digest == upload.sha256
+        if verified:
+            with open(path, 'rb') as part:
+                content = File(part, name=upload.filename)
+                # Lets the storage skip the copy when the blob already exists
+                content.sha256 = digest
+                document = ClaimDocument(claim_id=upload.claim_id, filename=upload.filename, size=upload.size, file=content)
+                document.save()
+            upload.status = 'Complete'
+            upload.document = document
+            upload.save(update_fields=['status', 'document', 'updated_at'])
+        else:
+            # The stored bytes are unusable; make the client start over
+            open(path, 'wb').close()
+            upload.received = 0
+            upload.save(update_fields=['received', 'updated_at'])
+
+    if not verified:
+        raise UploadError('Checksum mismatch, the upload was reset')
+    os.remove(path)
+    return document
+
+
+def abort_upload(upload):
+    if upload.status == 'Complete':
+        raise UploadError('Upload is already finalized', status=409)
+    path = part_path(upload)
+    upload.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale_uploads():
+    """Drop unfinished uploads idle for longer than TTL; returns how many went."""
+    cutoff = timezone.now() - timedelta(seconds=upload_options()['TTL'])
+    stale = list(ClaimUpload.objects.filter(status='Uploading', updated_at__lt=cutoff))
+    for upload in stale:
+        abort_upload(upload)
+    return len(stale)
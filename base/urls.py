@@ -3,6 +3,7 @@ from .views import (
     userLogin,
     logoutView,
     chatbot_interact,
+    chatbot_metrics,
     categories,
     submit_claim,
     join_policy, my_policies, submit_claim, list_claims,
@@ -13,6 +14,12 @@ from .views import (
     dashboard_summary,
     all_claims,
     process_claim,
+    process_claims_batch,
+    start_claim_upload,
+    claim_upload,
+    finalize_claim_upload,
+    claim_document,
+    document_derivative,
     # analytics_dashboard
 
 )
@@ -32,10 +39,17 @@ urlpatterns = [
     path('claim-timeline/<int:claim_id>/', claim_timeline),
     path("policies/<int:pk>/", get_policy_by_id),
     path("process-claim/<int:claim_id>/", process_claim),
+    path("process-claims/", process_claims_batch),
+    path('claims/<int:claim_id>/uploads/', start_claim_upload),
+    path('uploads/<uuid:upload_id>/', claim_upload),
+    path('uploads/<uuid:upload_id>/finalize/', finalize_claim_upload),
+    path('documents/<int:document_id>/', claim_document, name='claim-document'),
+    path('documents/<int:document_id>/<str:variant>/', document_derivative, name='claim-document-derivative'),
 
 
 
     path('chatbot-interaction/', chatbot_interact, name='chatbot-interation'),
+    path('chatbot-metrics/', chatbot_metrics),
     
     # Categories
     path('categories/', categories, name='list-categories'),
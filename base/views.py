@@ -1,4 +1,9 @@
 from django.shortcuts import render
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import viewsets
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
@@ -8,20 +13,38 @@ from django.shortcuts import get_object_or_404
 from rest_framework.exceptions import ValidationError
 from django.utils.crypto import get_random_string
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.contrib.auth import authenticate, login
 from django.views.decorators.csrf import csrf_exempt
-from .ai_logic import get_chatbot_response
+from .ai_logic import aget_chatbot_response, astream_chatbot_response
+from .authentication import user_roles
+from .llm import ChatbotBusyError
 from .models import (
-    UserPolicies, Category, Company, InsurancePolicy, Claim, Messages, Payment, User, Transaction, ClaimDocument
+    UserPolicies, Category, Company, InsurancePolicy, Claim, Messages, Payment, User, Transaction, ClaimDocument, ClaimUpload
 )
-from django.db.models import Sum, Count, Avg, Q, F, Max
+from django.db.models import Sum, Count, Avg, Q, F, Max, Exists, OuterRef, Subquery, Value, CharField, DateTimeField
+from django.db.models.functions import Cast
 from .serializers import (
-    UserPoliciesSerializer, CategorySerializer, CompanySerializer, InsurancePolicySerializer, ClaimSerializer, UserLoginSerializer, UserSerializer
+    UserPoliciesSerializer, CategorySerializer, CompanySerializer, InsurancePolicySerializer, ClaimSerializer, ClaimListSerializer, UserLoginSerializer, UserSerializer, ClaimDocumentSerializer
 )
+from .pagination import ClaimPagination, TransactionFeedPagination
+from .cache import dashboard_summary_key, DASHBOARD_SUMMARY_TIMEOUT, cached_catalog_payload, settled_last_modified
+from .chat_sessions import get_session_store
+from .response_cache import response_cache
+from .delivery import serve_file
+from .derivatives import UNSUPPORTED, VARIANTS, generate_derivatives
+from .uploads import UploadError, abort_upload, finalize_upload, start_upload, upload_options, write_chunk
+from .adjudication import MAX_BATCH, adjudicate_claims
+from .ledger import get_ledger, legacy_payouts, record_claim_payout, record_policy_payment
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.contrib.auth.models import Group
 import os
+import json
+import uuid
 from dateutil.relativedelta import relativedelta
 from datetime import timedelta
 from decimal import Decimal
@@ -95,25 +118,29 @@ def join_policy(request):
  
     expiry_date = timezone.now().date() + relativedelta(months=duration_months)
 
-    # Create policy subscription
-    user_policy = UserPolicies.objects.create(
-        user=request.user,
-        policy=policy,
-        plan_type=plan_type,
-        duration=duration_months,
-        momo_number=momo_number,
-        status="Active",
-        expiry_date=expiry_date
-    )
+    with transaction.atomic():
+        # Create policy subscription
+        user_policy = UserPolicies.objects.create(
+            user=request.user,
+            policy=policy,
+            plan_type=plan_type,
+            duration=duration_months,
+            momo_number=momo_number,
+            status="Active",
+            expiry_date=expiry_date,
+            periods_billed=1
+        )
 
-    # Log the first monthly payment only
-    Transaction.objects.create(
-        user=request.user,
-        policy_subscription=user_policy,
-        transaction_type="Policy Payment",
-        amount=monthly_price,  
-        momo_number=momo_number
-    )
+        # Log the first monthly payment only; bill_subscriptions charges the rest
+        Transaction.objects.create(
+            user=request.user,
+            policy_subscription=user_policy,
+            transaction_type="Policy Payment",
+            amount=monthly_price,  
+            momo_number=momo_number,
+            billing_period=1
+        )
+        record_policy_payment(request.user.id, monthly_price)
 
     return Response({'message': 'Successfully joined policy and first month\'s payment recorded.'}, status=status.HTTP_201_CREATED)
 
@@ -195,7 +222,8 @@ def submit_claim(request):
     for file in uploaded_files:
         ClaimDocument.objects.create(
             claim=claim,
-            file=file
+            file=file,
+            size=file.size
         )
     
     # Return more complete claim information
@@ -208,53 +236,123 @@ def submit_claim(request):
         'documents_uploaded': len(uploaded_files)
     }, status=status.HTTP_201_CREATED)
 
+def plan_types_for_claims(claims, **filters):
+    """Map (claimant_id, policy_id) to the subscription plan type in one query."""
+    user_ids = {claim.claimant_id for claim in claims}
+    policy_ids = {claim.policy_id for claim in claims}
+    if not user_ids:
+        return {}
+
+    subscriptions = UserPolicies.objects.filter(
+        user_id__in=user_ids,
+        policy_id__in=policy_ids,
+        **filters
+    ).order_by('id').values_list('user_id', 'policy_id', 'plan_type')
+
+    plan_types = {}
+    for user_id, policy_id, plan_type in subscriptions:
+        # Keep the first subscription, matching the old .first() lookup
+        plan_types.setdefault((user_id, policy_id), plan_type)
+    return plan_types
+
+def filter_claims(claims, params, allow_claimant=False):
+    """Apply the optional status/policy/date/claimant query filters."""
+    claim_status = params.get('status')
+    if claim_status:
+        claims = claims.filter(status=claim_status)
+
+    lookups = {'policy': 'policy_id'}
+    if allow_claimant:
+        lookups['claimant'] = 'claimant_id'
+    for param, field in lookups.items():
+        value = params.get(param)
+        if value:
+            if not value.isdigit():
+                raise ValidationError({param: 'Must be an integer id.'})
+            claims = claims.filter(**{field: int(value)})
+
+    for param, lookup in (('date_from', 'claim_date__date__gte'), ('date_to', 'claim_date__date__lte')):
+        value = params.get(param)
+        if value:
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                raise ValidationError({param: 'Use the YYYY-MM-DD format.'})
+            claims = claims.filter(**{lookup: day})
+
+    return claims
+
+def paginated_claims_response(request, claims, **subscription_filters):
+    paginator = ClaimPagination()
+    page = paginator.paginate_queryset(
+        claims.select_related('claimant', 'policy').prefetch_related('documents'),
+        request
+    )
+    serializer = ClaimListSerializer(page, many=True, context={
+        'request': request,
+        'plan_types': plan_types_for_claims(page, **subscription_filters)
+    })
+    return paginator.get_paginated_response(serializer.data)
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def list_claims(request):
-    claims = Claim.objects.filter(claimant=request.user)
-    data = []
-    
-    for claim in claims:
-        # Get user's plan type for this claim
-        user_subscription = UserPolicies.objects.filter(
-            user=request.user,
-            policy=claim.policy,
-            status='Active'
-        ).first()
-        
-        claim_data = {
-            'id': claim.id,
-            'claim_number': claim.claim_number,
-            'title': claim.title,
-            'policy_name': claim.policy.name,
-            'policy_type': user_subscription.plan_type if user_subscription else 'Unknown',
-            'claim_amount': claim.claim_amount,
-            'payout_amount': claim.payout_amount,
-            'status': claim.status,
-            'claim_date': claim.claim_date,
-            'approval_date': claim.approval_date,
-            'adjustment_note': claim.adjustment_note,
-            'description': claim.description,
-            'documents': [
-                {
-                    'id': doc.id,
-                    'file_url': request.build_absolute_uri(doc.file.url), 
-                    'filename': os.path.basename(doc.file.name),
-                    'uploaded_at': doc.uploaded_at
-                } for doc in claim.documents.all()
-            ]
-        }
-        data.append(claim_data)
-    
-    return Response(data)
+    claims = filter_claims(Claim.objects.filter(claimant=request.user), request.query_params)
+    # Plan type comes from the user's active subscription to the claim's policy
+    return paginated_claims_response(request, claims, status='Active')
+
+def catalog_response(request, name, build):
+    """Serve a cached catalog payload with ETag/Last-Modified and 304 support."""
+    entry = cached_catalog_payload(name, build)
+    if entry is None:
+        return None
+
+    last_modified = settled_last_modified(entry)
+    not_modified = get_conditional_response(request, etag=entry['etag'], last_modified=last_modified)
+    response = not_modified or HttpResponse(entry['content'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
 
 @api_view(["GET"])
 def list_policies(request):
-    policies = InsurancePolicy.objects.filter(is_active=True)
+    def build():
+        policies = InsurancePolicy.objects.filter(is_active=True).select_related('company', 'category')
+
+        data = []
+        for policy in policies:
+            data.append({
+                "id": policy.id,
+                "name": policy.name,
+                "description": policy.description,
+                "premium_coverage_amount": policy.premium_coverage_amount,
+                "regular_coverage_amount": policy.regular_coverage_amount,
+                "premium_price": policy.premium,
+                "regular_price": policy.regular,
+               
+                "company": {
+                    "name": policy.company.name,
+                    "contact": policy.company.contact,
+                    "rating": policy.company.rating
+                },
+                "category": policy.category.name if policy.category else None
+            })
+        return data
+
+    return catalog_response(request, 'policies', build)
+
+@api_view(["GET"])
+def get_policy_by_id(request, pk):
+    def build():
+        try:
+            policy = InsurancePolicy.objects.select_related('company', 'category').get(pk=pk)
+        except InsurancePolicy.DoesNotExist:
+            return None
 
-    data = []
-    for policy in policies:
-        data.append({
+        return {
             "id": policy.id,
             "name": policy.name,
             "description": policy.description,
@@ -262,173 +360,118 @@ def list_policies(request):
             "regular_coverage_amount": policy.regular_coverage_amount,
             "premium_price": policy.premium,
             "regular_price": policy.regular,
-           
+          
             "company": {
                 "name": policy.company.name,
                 "contact": policy.company.contact,
-                "rating": policy.company.rating
+                "rating": policy.company.rating,
+                "description": policy.company.description
             },
-            "category": policy.category.name if policy.category else None
-        })
-
-    return Response(data, status=status.HTTP_200_OK)
+            "category": policy.category.name if policy.category else None,
+            "is_active": policy.is_active
+        }
 
-@api_view(["GET"])
-def get_policy_by_id(request, pk):
-    try:
-        policy = InsurancePolicy.objects.get(pk=pk)
-    except InsurancePolicy.DoesNotExist:
+    response = catalog_response(request, f'policy:{pk}', build)
+    if response is None:
         return Response({"detail": "Policy not found."}, status=status.HTTP_404_NOT_FOUND)
-
-    data = {
-        "id": policy.id,
-        "name": policy.name,
-        "description": policy.description,
-        "premium_coverage_amount": policy.premium_coverage_amount,
-        "regular_coverage_amount": policy.regular_coverage_amount,
-        "premium_price": policy.premium,
-        "regular_price": policy.regular,
-      
-        "company": {
-            "name": policy.company.name,
-            "contact": policy.company.contact,
-            "rating": policy.company.rating,
-            "description": policy.company.description
-        },
-        "category": policy.category.name if policy.category else None,
-        "is_active": policy.is_active
+    return response
+
+# Columns shared by both sides of the transaction feed UNION, in select order
+TRANSACTION_FEED_COLUMNS = [
+    'row_source', 'row_id', 'sort_key', 'row_type', 'row_amount', 'row_momo',
+    'row_timestamp', 'sort_timestamp', 'policy_name', 'claim_number', 'claim_title',
+]
+
+def transaction_feed(user):
+    """Transactions and legacy payouts as UNION-compatible value querysets."""
+    transactions = Transaction.objects.filter(user=user).annotate(
+        row_source=Value('transaction', output_field=CharField()),
+        row_id=F('id'),
+        sort_key=F('id') * 2 + 1,
+        row_type=F('transaction_type'),
+        row_amount=F('amount'),
+        row_momo=F('momo_number'),
+        row_timestamp=F('timestamp'),
+        sort_timestamp=Cast('timestamp', DateTimeField()),
+        policy_name=F('policy_subscription__policy__name'),
+        claim_number=F('claim__claim_number'),
+        claim_title=F('claim__title'),
+    ).values(*TRANSACTION_FEED_COLUMNS)
+
+    # Legacy payouts borrow the momo number of the user's subscription
+    subscriptions = UserPolicies.objects.filter(
+        user=user,
+        policy=OuterRef('claim__policy')
+    ).order_by('id')
+    payments = legacy_payouts().filter(claim__claimant=user).filter(Exists(subscriptions)).annotate(
+        row_source=Value('payment', output_field=CharField()),
+        row_id=F('id'),
+        sort_key=F('id') * 2,
+        row_type=Value('Claim Payout', output_field=CharField()),
+        row_amount=F('amount'),
+        row_momo=Subquery(subscriptions.values('momo_number')[:1]),
+        row_timestamp=Cast('payment_date', DateTimeField()),
+        sort_timestamp=Cast('payment_date', DateTimeField()),
+        policy_name=F('claim__policy__name'),
+        claim_number=F('claim__claim_number'),
+        claim_title=F('claim__title'),
+    ).values(*TRANSACTION_FEED_COLUMNS)
+
+    return transactions, payments
+
+def transaction_feed_row(row):
+    transaction_data = {
+        "id": row['row_id'] if row['row_source'] == 'transaction' else f"payment_{row['row_id']}",
+        "amount": row['row_amount'],
+        "type": row['row_type'],
+        "momo_number": row['row_momo'],
+        "timestamp": row['row_timestamp'],
+        "policy_name": row['policy_name'],
     }
-    
-    return Response(data, status=status.HTTP_200_OK)
+
+    # Add claim information for claim payouts
+    if row['row_type'] == "Claim Payout" and row['claim_number']:
+        transaction_data.update({
+            "claim_number": row['claim_number'],
+            "claim_title": row['claim_title']
+        })
+    return transaction_data
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def recent_transactions(request):
-    # Get regular transactions (policy payments and claim payouts)
-    transactions = Transaction.objects.filter(user=request.user).order_by('-timestamp')
-    
-    data = []
-    for tx in transactions:
-        transaction_data = {
-            "id": tx.id,
-            "amount": tx.amount,
-            "type": tx.transaction_type,
-            "momo_number": tx.momo_number,
-            "timestamp": tx.timestamp,
-            "policy_name": tx.policy_subscription.policy.name,
-        }
-        
-        # Add claim information for claim payouts
-        if tx.transaction_type == "Claim Payout" and tx.claim:
-            transaction_data.update({
-                "claim_number": tx.claim.claim_number,
-                "claim_title": tx.claim.title
-            })
-        
-        data.append(transaction_data)
+    user = request.user
 
-    # For backward compatibility, also include claim payouts from Payment records 
-    # that don't have corresponding Transaction records
-    existing_claim_transaction_ids = set(
-        transactions.filter(transaction_type="Claim Payout", claim__isnull=False)
-        .values_list('claim_id', flat=True)
-    )
-    
-    # Get payments for approved claims that don't have transaction records
-    payments_without_transactions = Payment.objects.filter(
-        claim__claimant=request.user,
-        is_paid=True
-    ).exclude(claim_id__in=existing_claim_transaction_ids).select_related('claim', 'claim__policy')
-    
-    for payment in payments_without_transactions:
-        # Get user's subscription for this claim
-        user_subscription = UserPolicies.objects.filter(
-            user=request.user,
-            policy=payment.claim.policy
-        ).first()
-        
-        if user_subscription:
-            transaction_data = {
-                "id": f"payment_{payment.id}",  # Unique ID for payment-based transactions
-                "amount": payment.amount,
-                "type": "Claim Payout",
-                "momo_number": user_subscription.momo_number,
-                "timestamp": payment.payment_date,
-                "policy_name": payment.claim.policy.name,
-                "claim_number": payment.claim.claim_number,
-                "claim_title": payment.claim.title
-            }
-            data.append(transaction_data)
-
-    # Sort all transactions by timestamp (most recent first)
-    data.sort(key=lambda x: x['timestamp'], reverse=True)
-
-    # Calculate summary statistics
-    policy_payment_count = transactions.filter(transaction_type="Policy Payment").count()
-    claim_payout_count = transactions.filter(transaction_type="Claim Payout").count() + payments_without_transactions.count()
-    total_paid = transactions.filter(transaction_type="Policy Payment").aggregate(Sum("amount"))["amount__sum"] or 0
-    total_received = (
-        (transactions.filter(transaction_type="Claim Payout").aggregate(Sum("amount"))["amount__sum"] or 0) +
-        (payments_without_transactions.aggregate(Sum("amount"))["amount__sum"] or 0)
-    )
+    # Merge, order and limit both sources in the database
+    paginator = TransactionFeedPagination()
+    rows = paginator.paginate_union(transaction_feed(user), request)
+    data = [transaction_feed_row(row) for row in rows]
+
+    ledger = get_ledger(user)
 
     return Response({
         "transactions": data,
+        "next": paginator.get_next_link(),
         "summary": {
-            "policy_payment_count": policy_payment_count,
-            "claim_payout_count": claim_payout_count,
-            "total_paid": total_paid,
-            "total_received": total_received
+            "policy_payment_count": ledger.policy_payment_count,
+            "claim_payout_count": ledger.claim_payout_count,
+            "total_paid": ledger.total_paid,
+            "total_received": ledger.total_received
         }
     })
 
 def is_insurer(user):
-    return user.groups.filter(name='Insurer').exists()
+    return 'Insurer' in user_roles(user)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def all_claims(request):
     # For insurers to see all claims
-    if not request.user.groups.filter(name='Insurer').exists():
+    if not is_insurer(request.user):
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    claims = Claim.objects.all().order_by('-claim_date')
-    data = []
-    
-    for claim in claims:
-        # Get claimant's plan type
-        user_subscription = UserPolicies.objects.filter(
-            user=claim.claimant,
-            policy=claim.policy
-        ).first()
-        
-        claim_data = {
-            'id': claim.id,
-            'claim_number': claim.claim_number,
-            'title': claim.title,
-            'claimant': f"{claim.claimant.first_name} {claim.claimant.last_name}",
-            'claimant_email': claim.claimant.email,
-            'policy_name': claim.policy.name,
-            'policy_type': user_subscription.plan_type if user_subscription else 'Unknown',
-            'claim_amount': claim.claim_amount,
-            'payout_amount': claim.payout_amount,
-            'status': claim.status,
-            'claim_date': claim.claim_date,
-            'approval_date': claim.approval_date,
-            'adjustment_note': claim.adjustment_note,
-            'description': claim.description,
-            'documents': [
-                {
-                    'id': doc.id,
-                    'file_url': request.build_absolute_uri(doc.file.url),  
-                    'filename': os.path.basename(doc.file.name),
-                    'uploaded_at': doc.uploaded_at
-                } for doc in claim.documents.all()
-            ]
-        }
-        data.append(claim_data)
-    
-    return Response(data)
+    claims = filter_claims(Claim.objects.all(), request.query_params, allow_claimant=True)
+    return paginated_claims_response(request, claims)
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -480,26 +523,31 @@ def process_claim(request, claim_id):
         if adjustment_note:
             claim.adjustment_note = adjustment_note
 
-        # Prevent duplicate payments
-        if not Payment.objects.filter(claim=claim).exists():
-            Payment.objects.create(
-                claim=claim,
-                amount=payout_amount,
-                is_paid=True  # Mark as paid immediately for now
-            )
-            
-            # Create a claim payout transaction
-            if user_subscription:
-                Transaction.objects.create(
-                    user=claim.claimant,
-                    policy_subscription=user_subscription,
-                    transaction_type="Claim Payout",
+        with transaction.atomic():
+            # Prevent duplicate payments
+            if not Payment.objects.filter(claim=claim).exists():
+                Payment.objects.create(
                     claim=claim,
                     amount=payout_amount,
-                    momo_number=user_subscription.momo_number
+                    is_paid=True  # Mark as paid immediately for now
                 )
+                
+                # Create a claim payout transaction
+                if user_subscription:
+                    Transaction.objects.create(
+                        user=claim.claimant,
+                        policy_subscription=user_subscription,
+                        transaction_type="Claim Payout",
+                        claim=claim,
+                        amount=payout_amount,
+                        momo_number=user_subscription.momo_number
+                    )
+
+                # Counted once whether or not a Transaction row was written
+                record_claim_payout(claim.claimant_id, payout_amount)
+
+            claim.save()
 
-        claim.save()
         return Response({
             'message': 'Claim approved successfully',
             'claim_number': claim.claim_number,
@@ -518,6 +566,29 @@ def process_claim(request, claim_id):
             'adjustment_note': claim.adjustment_note
         })
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def process_claims_batch(request):
+    """Approve or deny many claims at once: {"decisions": [{claim_id, status, payout_amount, adjustment_note}]}"""
+    if not is_insurer(request.user):
+        return Response({'error': 'Only insurers can process claims'}, status=status.HTTP_403_FORBIDDEN)
+
+    decisions = request.data.get('decisions')
+    if not isinstance(decisions, list) or not decisions:
+        return Response({'error': 'decisions must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(decisions) > MAX_BATCH:
+        return Response({'error': f'At most {MAX_BATCH} decisions per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = adjudicate_claims(decisions)
+    processed = [result for result in results if result['ok']]
+    return Response({
+        'processed': len(processed),
+        'approved': sum(1 for result in processed if result['status'] == 'Approved'),
+        'denied': sum(1 for result in processed if result['status'] == 'Denied'),
+        'failed': len(results) - len(processed),
+        'results': results
+    })
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def claim_timeline(request, claim_id):
@@ -563,67 +634,133 @@ def claim_timeline(request, claim_id):
 
     return Response({"timeline": timeline})
 
-@api_view(['POST'])
-def chatbot_interact(request):
+def read_request_data(request):
+    """Parse a JSON or form body for plain (non-DRF) views."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+def is_true(value):
+    """JSON true or the form strings 'true'/'1'; 'false', '0' and the like are off."""
+    return value is True or (isinstance(value, str) and value.strip().lower() in ('true', '1'))
+
+def server_sent_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, cls=DjangoJSONEncoder)}\n\n"
+
+async def chatbot_event_stream(user_input, session_id):
+    """
+    Stream the reply as server-sent events: one `token` event per piece of
+    text, then a `done` (or `error`) event carrying the same body the
+    non-streaming endpoint returns.
+    """
+    events = astream_chatbot_response(user_input, session_id)
+    # Wait for the first event so a saturated LLM still gets a plain 503
+    first_event = await events.__anext__()
+
+    async def stream():
+        event, payload = first_event
+        try:
+            while True:
+                if event == 'token':
+                    yield server_sent_event('token', {'token': payload})
+                else:
+                    yield server_sent_event(event, {
+                        "success": event == 'done',
+                        "chatbot_response": payload.get('chatbot_response'),
+                        "policies_response": payload.get('policies_response'),
+                        "session_id": session_id
+                    })
+                try:
+                    event, payload = await events.__anext__()
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Frees the LLM slot right away if the client disconnects
+            await events.aclose()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass tokens through
+    return response
+
+# Plain async Django view: DRF views are sync-only, and the LLM round trip
+# must not hold a worker thread when served through insureMeB/asgi.py.
+@csrf_exempt
+@require_POST
+async def chatbot_interact(request):
     try:
+        data = read_request_data(request)
+        if data is None:
+            return JsonResponse({"error": "Malformed request body"}, status=status.HTTP_400_BAD_REQUEST)
+
         # Get user input from request data
-        user_input = request.data.get('user_input')
-        session_id = request.data.get('session_id', 'default')  # Optional session ID
+        user_input = data.get('user_input')
+        # Optional session ID; without one the caller starts a fresh conversation
+        session_id = data.get('session_id') or uuid.uuid4().hex
+        if not isinstance(session_id, str) or len(session_id) > 64:
+            return JsonResponse({
+                "error": "session_id must be a string of at most 64 characters"
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Validate input
-        if not user_input or not user_input.strip():
-            return Response({
+        if not isinstance(user_input, str) or not user_input.strip():
+            return JsonResponse({
                 "error": "user_input is required and cannot be empty"
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        if is_true(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', ''):
+            return await chatbot_event_stream(user_input.strip(), session_id)
+
         # Get chatbot response
-        response = get_chatbot_response(user_input.strip(), session_id)
+        response = await aget_chatbot_response(user_input.strip(), session_id)
         
         # Return successful response
-        return Response({
+        return JsonResponse({
             "success": True,
             "chatbot_response": response.get('chatbot_response'),
             "policies_response": response.get('policies_response'),
             "session_id": session_id
         }, status=status.HTTP_200_OK)
+
+    except ChatbotBusyError:
+        response = JsonResponse({
+            "success": False,
+            "error": "Chat service is busy",
+            "chatbot_response": "Sorry, I'm handling a lot of conversations right now. Please try again shortly."
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = '5'
+        return response
         
     except Exception as e:
         print(f"Chatbot API Error: {e}")
-        return Response({
+        return JsonResponse({
             "success": False,
             "error": "Internal server error",
             "chatbot_response": "Sorry, I'm having trouble processing your request right now."
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def chatbot_metrics(request):
+    """Session store and response cache counters, as seen by this worker."""
+    return Response({
+        "sessions": get_session_store().stats(),
+        "response_cache": response_cache.stats()
+    })
+
 # list main categories
 @api_view(['GET'])
 def categories(request):
-    categories = Category.objects.all()
-    category_serializer = CategorySerializer(categories, many=True)
-    response_data = {'categories': category_serializer.data}
-    return Response(response_data, status=status.HTTP_200_OK)
-
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def dashboard_summary(request):
-    user = request.user
+    def build():
+        categories = Category.objects.all()
+        category_serializer = CategorySerializer(categories, many=True)
+        return {'categories': category_serializer.data}
 
-    # Customize depending on your models
-    active_policies = UserPolicies.objects.filter(user=user, status="active").count()
-    total_claims = Claim.objects.filter(claimant=user).count()
-    pending_claims = Claim.objects.filter(claimant=user, status="Pending").count()
-    approved_claims = Claim.objects.filter(claimant=user, status="Approved").count()
-    total_paid = Transaction.objects.filter(user=user, transaction_type="Policy Payment").aggregate(Sum("amount"))["amount__sum"] or 0
-    total_received = Transaction.objects.filter(user=user, transaction_type="Claim Payout").aggregate(Sum("amount"))["amount__sum"] or 0
-
-    return Response({
-        "active_policies": active_policies,
-        "total_claims": total_claims,
-        "pending_claims": pending_claims,
-        "approved_claims": approved_claims,
-        "total_paid": total_paid,
-        "total_received": total_received,
-    })
+    return catalog_response(request, 'categories', build)
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -646,7 +783,8 @@ def upload_claim_document(request, claim_id):
     for file in uploaded_files:
         doc = ClaimDocument.objects.create(
             claim=claim,
-            file=file
+            file=file,
+            size=file.size
         )
         documents.append({
             'id': doc.id,
@@ -660,6 +798,115 @@ def upload_claim_document(request, claim_id):
     }, status=status.HTTP_201_CREATED)
 
 
+def viewable_document(request, document_id):
+    document = get_object_or_404(ClaimDocument.objects.select_related('claim'), id=document_id)
+    if document.claim.claimant_id != request.user.id and not is_insurer(request.user):
+        raise Http404
+    return document
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def claim_document(request, document_id):
+    """Serve a claim document to its claimant or an insurer"""
+    document = viewable_document(request, document_id)
+    filename = document.filename or os.path.basename(document.file.name)
+    return serve_file(request, document.file.storage, document.file.name, filename)
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def document_derivative(request, document_id, variant):
+    """Serve a document's thumbnail or preview, rendering it if the pool has not yet"""
+    document = viewable_document(request, document_id)
+    if variant not in VARIANTS:
+        return Response({'error': f'Unknown variant {variant}'}, status=status.HTTP_404_NOT_FOUND)
+
+    # A document already found unrenderable is not decoded again on every request
+    if document.derivatives.get(UNSUPPORTED):
+        name = None
+    else:
+        name = document.derivatives.get(variant) or generate_derivatives(document).get(variant)
+    if not name:
+        return Response({'error': 'No preview is available for this document'}, status=status.HTTP_404_NOT_FOUND)
+    filename = f"{os.path.splitext(document.filename or 'document')[0]}-{variant}.jpg"
+    return serve_file(request, default_storage, name, filename)
+
+def upload_state(upload):
+    return {
+        'upload_id': upload.id,
+        'filename': upload.filename,
+        'size': upload.size,
+        'received': upload.received,
+        'status': upload.status,
+        'chunk_size': upload_options()['CHUNK_SIZE'],
+    }
+
+def upload_error(error, upload=None):
+    data = {'error': str(error)}
+    if upload is not None:
+        data['received'] = upload.received
+    return Response(data, status=error.status)
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def start_claim_upload(request, claim_id):
+    """Open a resumable upload for one document of the user's claim"""
+    claim = get_object_or_404(Claim, id=claim_id, claimant=request.user)
+
+    if claim.status not in ['Pending', 'Submitted']:
+        return Response({
+            'error': 'Cannot upload documents to processed claims'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        upload = start_upload(
+            claim,
+            request.data.get('filename'),
+            request.data.get('size'),
+            request.data.get('sha256', '')
+        )
+    except UploadError as e:
+        return upload_error(e)
+    return Response(upload_state(upload), status=status.HTTP_201_CREATED)
+
+@api_view(["GET", "PUT", "DELETE"])
+@permission_classes([IsAuthenticated])
+def claim_upload(request, upload_id):
+    """
+    GET reports how much is stored, PUT appends a byte range given by
+    Content-Range, DELETE abandons the upload.
+    """
+    upload = get_object_or_404(ClaimUpload, id=upload_id, claim__claimant=request.user)
+
+    try:
+        if request.method == "PUT":
+            try:
+                length = int(request.headers.get('Content-Length') or 0)
+            except ValueError:
+                raise UploadError('Invalid Content-Length header')
+            # Read the raw body as a stream so chunks never sit in memory whole
+            write_chunk(upload, request.stream, request.headers.get('Content-Range'), length)
+        elif request.method == "DELETE":
+            abort_upload(upload)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+    except UploadError as e:
+        return upload_error(e, upload)
+    return Response(upload_state(upload))
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def finalize_claim_upload(request, upload_id):
+    """Check the received bytes and attach them to the claim as a document"""
+    upload = get_object_or_404(ClaimUpload, id=upload_id, claim__claimant=request.user)
+
+    try:
+        document = finalize_upload(upload)
+    except UploadError as e:
+        upload.refresh_from_db()
+        return upload_error(e, upload)
+    return Response(
+        ClaimDocumentSerializer(document, context={'request': request}).data,
+        status=status.HTTP_201_CREATED
+    )
 
 
 
@@ -668,19 +915,30 @@ def upload_claim_document(request, claim_id):
 def dashboard_summary(request):
     user = request.user
 
-    # Customize depending on your models
-    active_policies = UserPolicies.objects.filter(user=user, status="Active").count()
-    total_claims = Claim.objects.filter(claimant=user).count()
-    pending_claims = Claim.objects.filter(claimant=user, status="Pending").count()
-    approved_claims = Claim.objects.filter(claimant=user, status="Approved").count()
-    total_paid = Transaction.objects.filter(user=user, transaction_type="Policy Payment").aggregate(Sum("amount"))["amount__sum"] or 0
-    total_received = Transaction.objects.filter(user=user, transaction_type="Claim Payout").aggregate(Sum("amount"))["amount__sum"] or 0
+    cache_key = dashboard_summary_key(user.id)
+    summary = cache.get(cache_key)
+    if summary is not None:
+        return Response(summary)
 
-    return Response({
-        "active_policies": active_policies,
-        "total_claims": total_claims,
-        "pending_claims": pending_claims,
-        "approved_claims": approved_claims,
-        "total_paid": total_paid,
-        "total_received": total_received,
-    })
+    # One conditional aggregate per table instead of a query per number
+    policy_stats = UserPolicies.objects.filter(user=user).aggregate(
+        active_policies=Count('id', filter=Q(status="Active"))
+    )
+    claim_stats = Claim.objects.filter(claimant=user).aggregate(
+        total_claims=Count('id'),
+        pending_claims=Count('id', filter=Q(status="Pending")),
+        approved_claims=Count('id', filter=Q(status="Approved"))
+    )
+    ledger = get_ledger(user)
+
+    summary = {
+        "active_policies": policy_stats["active_policies"],
+        "total_claims": claim_stats["total_claims"],
+        "pending_claims": claim_stats["pending_claims"],
+        "approved_claims": claim_stats["approved_claims"],
+        "total_paid": ledger.total_paid,
+        "total_received": ledger.total_received,
+    }
+    cache.set(cache_key, summary, DASHBOARD_SUMMARY_TIMEOUT)
+
+    return Response(summary)
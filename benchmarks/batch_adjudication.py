@@ -0,0 +1,111 @@
+"""
+Compare claims adjudicated per second through process_claim, one request
+per claim, and through the batch adjudication path.
+
+    python benchmarks/batch_adjudication.py --claims 20000
+
+The dataset is written to a throwaway database file (see --db), never to
+db.sqlite3.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'insureMeB.settings')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--claims', type=int, default=20000, help='claims adjudicated through the batch path')
+    parser.add_argument('--single', type=int, default=500, help='claims adjudicated one request at a time')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=5000, help='decisions per batch request')
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'insureme_adjudication.sqlite3'))
+    return parser.parse_args()
+
+
+def setup_django(db_path):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = db_path
+    django.setup()
+
+
+def seed(claims, users):
+    from django.contrib.auth.models import Group, User
+    from django.db import transaction
+    from base.ledger import rebuild_ledger
+    from base.models import Category, Claim, Company, InsurancePolicy, UserPolicies
+
+    with transaction.atomic():
+        insurer = User.objects.create(username='insurer')
+        insurer.groups.add(Group.objects.create(name='Insurer'))
+        category = Category.objects.create(name='Auto')
+        company = Company.objects.create(company_category=category, admin=insurer,
+                                         name='Bench Co', description='Benchmark company')
+        policy = InsurancePolicy.objects.create(
+            company=company, category=category, name='Bench Policy', description='',
+            premium_coverage_amount=10000, regular_coverage_amount=5000, premium=100, regular=50
+        )
+        User.objects.bulk_create([User(username=f'member{i}', password='!') for i in range(users)])
+        members = list(User.objects.exclude(pk=insurer.pk))
+        UserPolicies.objects.bulk_create([
+            UserPolicies(user=member, policy=policy, plan_type='Regular', duration=12, momo_number='0240000000')
+            for member in members
+        ])
+        Claim.objects.bulk_create([
+            Claim(policy=policy, title='Claim', claimant=members[i % len(members)],
+                  claim_number=f'CLM-{i:010d}', description='', claim_amount=100)
+            for i in range(claims)
+        ], batch_size=5000)
+        for member in members:
+            rebuild_ledger(member.id)
+    return insurer
+
+
+def main():
+    args = parse_args()
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    setup_django(args.db)
+
+    from django.core.management import call_command
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from base.adjudication import adjudicate_claims
+    from base.models import Claim
+    from base.views import process_claim
+
+    call_command('migrate', verbosity=0)
+    insurer = seed(args.claims + args.single, args.users)
+    claim_ids = list(Claim.objects.order_by('id').values_list('id', flat=True))
+    single_ids, batch_ids = claim_ids[:args.single], claim_ids[args.single:]
+
+    factory = APIRequestFactory()
+    started = time.perf_counter()
+    for claim_id in single_ids:
+        request = factory.post(f'/api/process-claim/{claim_id}/', {'status': 'Approved', 'payout_amount': '10'})
+        force_authenticate(request, insurer)
+        process_claim(request, claim_id)
+    elapsed = time.perf_counter() - started
+    print(f"process_claim: {len(single_ids)} claims in {elapsed:.2f}s, {len(single_ids) / elapsed:,.0f} claims/s")
+
+    started = time.perf_counter()
+    for start in range(0, len(batch_ids), args.batch):
+        adjudicate_claims([
+            {'claim_id': claim_id, 'status': 'Approved', 'payout_amount': '10'}
+            for claim_id in batch_ids[start:start + args.batch]
+        ])
+    elapsed = time.perf_counter() - started
+    print(f"batch:         {len(batch_ids)} claims in {elapsed:.2f}s, {len(batch_ids) / elapsed:,.0f} claims/s")
+
+    call_command('rebuild_ledgers', '--verify')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Measure what a cold worker pays to import the app, with and without the LLM
+client being built.
+
+    python benchmarks/import_time.py --repeat 10
+
+Each run is a fresh interpreter that sets Django up and imports base.views,
+the way a gunicorn worker or a management command does. The "prewarmed" run
+also calls base.llm.prewarm(), which is what every import used to cost
+before the Groq client was created lazily.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    'import base.views': "",
+    'import base.views + prewarm': "from base.llm import prewarm; prewarm()",
+}
+
+PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import base.views
+{extra}
+print(json.dumps({{
+    'seconds': time.perf_counter() - started,
+    'groq_loaded': 'groq' in sys.modules,
+    'modules': len(sys.modules),
+}}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='fresh interpreters per scenario')
+    return parser.parse_args()
+
+
+def run(extra):
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'insureMeB.settings',
+        # A key is needed for the client to be built at all; nothing is sent
+        'GROQ_API_KEY': os.environ.get('GROQ_API_KEY', 'benchmark-key'),
+    }
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(extra=extra)],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    for name, extra in SCENARIOS.items():
+        results = [run(extra) for _ in range(args.repeat)]
+        timings = [result['seconds'] * 1000 for result in results]
+        print(f"{name:<32} median {statistics.median(timings):8.1f} ms  "
+              f"min {min(timings):8.1f} ms  modules {results[-1]['modules']:5d}  "
+              f"groq loaded: {results[-1]['groq_loaded']}")
+
+
+if __name__ == '__main__':
+    main()
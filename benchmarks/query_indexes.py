@@ -0,0 +1,187 @@
+"""
+Compare EXPLAIN plans and timings of the hot dashboard queries before and
+after the 0011 index migration on a synthetic SQLite dataset.
+
+    python benchmarks/query_indexes.py --rows 1000000
+
+The dataset is written to a throwaway database file (see --db), never to
+db.sqlite3.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'insureMeB.settings')
+
+BEFORE_MIGRATION = '0010_remove_insurancepolicy_duration'
+AFTER_MIGRATION = '0011_add_query_indexes'
+BATCH_SIZE = 50000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='rows per large table (claims, subscriptions, transactions, payments)')
+    parser.add_argument('--users', type=int, default=None,
+                        help='number of users, defaults to rows / 20')
+    parser.add_argument('--repeat', type=int, default=200, help='timed runs per query')
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'insureme_bench.sqlite3'))
+    return parser.parse_args()
+
+
+def setup_django(db_path):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = db_path
+    django.setup()
+
+
+def batched(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert(cursor, model, columns, rows):
+    table = model._meta.db_table
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    for batch in batched(rows):
+        cursor.executemany(sql, batch)
+
+
+def seed(rows, users):
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from base.models import Category, Claim, Company, InsurancePolicy, Payment, Transaction, UserPolicies
+
+    rng = random.Random(42)
+    start = datetime(2022, 1, 1, tzinfo=dt_timezone.utc)
+    policy_count = 50
+
+    def moment():
+        return start + timedelta(seconds=rng.randrange(3 * 365 * 24 * 3600))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        insert(cursor, User, ['password', 'username', 'first_name', 'last_name', 'email',
+                              'is_superuser', 'is_staff', 'is_active', 'date_joined'],
+               (('!', f'user{i}', '', '', '', False, False, True, start) for i in range(users)))
+        user_ids = list(User.objects.values_list('id', flat=True))
+        admin = User.objects.get(username='user0')
+
+        category = Category.objects.create(name='Auto')
+        company = Company.objects.create(company_category=category, admin=admin,
+                                         name='Bench Co', description='Benchmark company')
+        InsurancePolicy.objects.bulk_create([
+            InsurancePolicy(company=company, category=category, name=f'Policy {i}', description='',
+                            premium_coverage_amount=10000, regular_coverage_amount=5000,
+                            premium=100, regular=50)
+            for i in range(policy_count)
+        ])
+        policy_ids = list(InsurancePolicy.objects.values_list('id', flat=True))
+
+        insert(cursor, UserPolicies, ['user_id', 'policy_id', 'plan_type', 'duration', 'momo_number',
+                                      'creation_date', 'status', 'expiry_date'],
+               ((rng.choice(user_ids), rng.choice(policy_ids), rng.choice(['Premium', 'Regular']), 12,
+                 '0240000000', moment(), rng.choice(['Active', 'Active', 'On Pause', 'Complete']), None)
+                for _ in range(rows)))
+        subscriptions = list(UserPolicies.objects.values_list('id', 'user_id')[:100000])
+
+        insert(cursor, Claim, ['policy_id', 'title', 'claimant_id', 'claim_number', 'description',
+                               'claim_amount', 'status', 'claim_date'],
+               ((rng.choice(policy_ids), 'Claim', rng.choice(user_ids), f'CLM-{i:010d}', '', 100,
+                 rng.choice(['Pending', 'Approved', 'Denied']), moment())
+                for i in range(rows)))
+        claim_ids = list(Claim.objects.values_list('id', flat=True)[:100000])
+
+        def transactions():
+            for _ in range(rows):
+                sub_id, user_id = rng.choice(subscriptions)
+                yield (user_id, sub_id, rng.choice(['Policy Payment', 'Policy Payment', 'Claim Payout']),
+                       None, 50, '0240000000', moment())
+        insert(cursor, Transaction, ['user_id', 'policy_subscription_id', 'transaction_type', 'claim_id',
+                                     'amount', 'momo_number', 'timestamp'], transactions())
+
+        insert(cursor, Payment, ['claim_id', 'amount', 'payment_date', 'is_paid'],
+               ((rng.choice(claim_ids), 100, moment().date(), rng.random() < 0.7) for _ in range(rows)))
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return user_ids, policy_ids, claim_ids
+
+
+def hot_queries(user_ids, policy_ids, claim_ids):
+    from base.models import Claim, Payment, Transaction, UserPolicies
+
+    rng = random.Random(7)
+    # The schema stops at 0010/0011, so leave out columns later migrations added
+    return {
+        'subscription lookup': lambda: UserPolicies.objects.filter(
+            user_id=rng.choice(user_ids), policy_id=rng.choice(policy_ids), status='Active'
+        ).only('id', 'user_id', 'policy_id', 'plan_type', 'status', 'expiry_date'),
+        'claims by status': lambda: Claim.objects.filter(
+            claimant_id=rng.choice(user_ids), status='Pending'),
+        'claim feed page': lambda: Claim.objects.order_by('-claim_date', '-id')[:50],
+        'user claim page': lambda: Claim.objects.filter(
+            claimant_id=rng.choice(user_ids)).order_by('-claim_date', '-id')[:50],
+        'transactions by type': lambda: Transaction.objects.filter(
+            user_id=rng.choice(user_ids), transaction_type='Policy Payment'
+        ).only('id', 'user_id', 'transaction_type', 'amount', 'timestamp').order_by('-timestamp')[:50],
+        'paid payment by claim': lambda: Payment.objects.filter(
+            claim_id=rng.choice(claim_ids), is_paid=True),
+    }
+
+
+def measure(label, queries, repeat):
+    print(f"\n===== {label} =====")
+    for name, build in queries.items():
+        print(f"\n--- {name}\n{build().explain()}")
+        started = time.perf_counter()
+        for _ in range(repeat):
+            list(build())
+        elapsed = (time.perf_counter() - started) / repeat * 1000
+        print(f"avg {elapsed:.3f} ms over {repeat} runs")
+
+
+def main():
+    args = parse_args()
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    setup_django(args.db)
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('migrate', verbosity=0)
+    call_command('migrate', 'base', BEFORE_MIGRATION, verbosity=0)
+
+    users = args.users or max(args.rows // 20, 1)
+    print(f"Seeding {args.rows} rows per table for {users} users into {args.db}")
+    started = time.perf_counter()
+    ids = seed(args.rows, users)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    queries = hot_queries(*ids)
+    measure('before indexes', queries, args.repeat)
+
+    call_command('migrate', 'base', AFTER_MIGRATION, verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    measure('after indexes', queries, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Time a billing run over many subscriptions, with one or more workers, and
+check a second run for the same date charges nothing.
+
+    python benchmarks/subscription_billing.py --subscriptions 200000 --workers 4
+
+--workers only takes effect against a database server; on SQLite billing
+always runs in one process.
+The dataset is written to a throwaway database file (see --db), never to
+db.sqlite3.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'insureMeB.settings')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscriptions', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'insureme_billing.sqlite3'))
+    return parser.parse_args()
+
+
+def setup_django(db_path):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = db_path
+    django.setup()
+
+
+def seed(subscriptions, users, today):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from base.models import Category, Company, InsurancePolicy, UserPolicies
+
+    with transaction.atomic():
+        admin = User.objects.create(username='admin')
+        category = Category.objects.create(name='Auto')
+        company = Company.objects.create(company_category=category, admin=admin,
+                                         name='Bench Co', description='Benchmark company')
+        policy = InsurancePolicy.objects.create(
+            company=company, category=category, name='Bench Policy', description='',
+            premium_coverage_amount=10000, regular_coverage_amount=5000, premium=100, regular=50
+        )
+        User.objects.bulk_create([User(username=f'member{i}', password='!') for i in range(users)])
+        member_ids = list(User.objects.exclude(pk=admin.pk).values_list('id', flat=True))
+        UserPolicies.objects.bulk_create([
+            UserPolicies(user_id=member_ids[i % len(member_ids)], policy=policy,
+                         plan_type='Premium' if i % 3 == 0 else 'Regular', duration=12,
+                         momo_number='0240000000', periods_billed=1)
+            for i in range(subscriptions)
+        ], batch_size=5000)
+        # Spread start dates over the last year so runs bill one to twelve months each
+        subscription_ids = list(UserPolicies.objects.order_by('id').values_list('id', flat=True))
+        for months in range(12):
+            joined = today - timedelta(days=30 * months + 1)
+            UserPolicies.objects.filter(id__in=subscription_ids[months::12]).update(
+                creation_date=datetime(joined.year, joined.month, joined.day, tzinfo=timezone.utc)
+            )
+
+
+def main():
+    args = parse_args()
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    setup_django(args.db)
+
+    from django.core.management import call_command
+    from base.billing import bill_subscriptions
+
+    call_command('migrate', verbosity=0)
+    today = date.today()
+    seed(args.subscriptions, args.users, today)
+
+    started = time.perf_counter()
+    read, charged = bill_subscriptions(today, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    print(f"first run:  {read} subscriptions, {charged} charges in {elapsed:.2f}s "
+          f"({read / elapsed:,.0f} subscriptions/s, {args.workers} workers)")
+
+    started = time.perf_counter()
+    read, charged = bill_subscriptions(today, args.workers, args.chunk_size)
+    print(f"second run: {read} subscriptions, {charged} charges in {time.perf_counter() - started:.2f}s")
+
+    call_command('rebuild_ledgers', '--verify')
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,13 @@ import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Pick up GROQ_API_KEY and the CHATBOT_* settings from a local .env file
+try:
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+except ImportError:
+    pass
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -90,6 +97,29 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) in production
+# so invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'insureme'),
+    }
+}
+
+
+# Chatbot conversation history store (see base/chat_sessions.py)
+
+CHATBOT_SESSIONS = {
+    'BACKEND': os.getenv('CHATBOT_SESSION_BACKEND', 'base.chat_sessions.DatabaseSessionStore'),
+    'TTL': 60 * 60 * 24,  # seconds a session may sit idle
+    'MAX_SESSIONS': 10000,
+    'MAX_BYTES': 50 * 1024 * 1024,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -135,7 +165,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'base.authentication.CachedTokenAuthentication',
     ],
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
@@ -147,4 +177,25 @@ REST_FRAMEWORK = {
 
 # Media files configuration
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Resumable claim document uploads (see base/uploads.py)
+
+CLAIM_UPLOADS = {
+    'CHUNK_SIZE': 1024 * 1024,  # PUT size suggested to clients
+    'MAX_FILE_BYTES': 25 * 1024 * 1024,
+    'MAX_CLAIM_BYTES': 100 * 1024 * 1024,  # documents plus open uploads of one claim
+    'TEMP_DIR': os.path.join(BASE_DIR, 'claim_uploads'),  # never under MEDIA_ROOT
+    'TTL': 60 * 60 * 24,  # seconds before an unfinished upload can be purged
+}
+
+
+# Claim document delivery (see base/delivery.py). 'accel' needs an nginx
+# location like:
+#     location /protected-media/ { internal; alias /path/to/media/; }
+
+DOCUMENT_DELIVERY = {
+    'MODE': os.getenv('DOCUMENT_DELIVERY_MODE', 'python'),  # 'python', 'accel' or 'sendfile'
+    'ACCEL_PREFIX': '/protected-media/',
+    'MAX_AGE': 60 * 60,
+}
@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from base.delivery import serve_public_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,4 +28,12 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # Like static(), minus claim documents and their derivatives, which only
+    # go out through api/documents/ after an access check
+    urlpatterns += [
+        re_path(
+            r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip('/')),
+            serve_public_media,
+            kwargs={'document_root': settings.MEDIA_ROOT}
+        ),
+    ]